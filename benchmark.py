@@ -0,0 +1,387 @@
+"""Benchmark de las etapas críticas de ventoy_config_gui sobre un USB sintético
+
+Genera en un directorio temporal un USB con N ISOs (nombres de distribuciones
+reales), un tema con M iconos y una base de datos con K claves, y mide la
+detección, la búsqueda de iconos, actualizar_json y rescanear_iconos_tema con
+la lógica sin interfaz (VentoyConfig), así que no se abre ninguna ventana.
+
+También comprueba que el modelo de menu_class escala de forma lineal: el coste
+por ISO de 10 a 50 000 nombres no debe crecer más de MAXIMO_CRECIMIENTO_ESCALADO.
+Sale con código 1 si no se cumple ese objetivo o el de arranque de --estado y
+--validar (OBJETIVO_ARRANQUE_MS, sin importar tkinter).
+
+Uso:
+    python benchmark.py --isos 500 --iconos 300 --claves 2000 --salida bench.json
+    python benchmark.py --comparar bench_anterior.json
+    python benchmark.py --escalado 10,100,1000,10000,50000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ventoy_config_gui as vcg
+
+PATRONES_ISO = [
+    "ubuntu-{v}-desktop-amd64",
+    "ubuntu-{v}-live-server-amd64",
+    "debian-{v}-amd64-netinst",
+    "debian-live-{v}-amd64-kde",
+    "linuxmint-{v}-cinnamon-64bit",
+    "linuxmint-{v}-xfce-64bit",
+    "Fedora-Workstation-Live-x86_64-{m}",
+    "archlinux-{f}-x86_64",
+    "manjaro-kde-{v}-minimal-{f}-linux66",
+    "openSUSE-Tumbleweed-DVD-x86_64-Snapshot{f}-Media",
+    "Win10_22H2_Spanish_x64v{m}",
+    "Win11_24H2_English_x64",
+    "BookwormPup64_{v}",
+    "Zorin-OS-{m}-Core-64-bit",
+    "pop-os_{v}_amd64_nvidia_{m}",
+    "kali-linux-{f}-installer-amd64",
+    "elementaryos-{v}-stable.{f}",
+    "bazzite-deck-gnome-stable",
+    "CentOS-Stream-{m}-{f}.0-x86_64-dvd1",
+    "tails-amd64-{v}",
+    "herramientas-{f}",
+    "rescate_{m}_{f}",
+]
+
+TAMANOS_ESCALADO = (10, 100, 1000, 10000, 50000)
+REFERENCIA_ESCALADO = 1000          # Por debajo, el coste fijo domina la medida por ISO
+MAXIMO_CRECIMIENTO_ESCALADO = 3.0   # Coste por ISO en el N mayor frente al de la referencia
+
+ICONOS_REALES = [
+    "ubuntu", "debian", "linuxmint", "fedora", "archlinux", "manjaro", "opensuse",
+    "windows", "windows11", "zorin-os", "popos", "kali", "elementary", "bazzite",
+    "centos", "tails", "puppy", "unknown",
+]
+
+
+def generar_nombre_iso(azar, usados):
+    """Nombre de ISO único con el aspecto de una distribución real"""
+    while True:
+        nombre = azar.choice(PATRONES_ISO).format(
+            v=f"{azar.randint(1, 24)}.{azar.randint(0, 10)}",
+            m=azar.randint(7, 42),
+            f=f"{azar.randint(2019, 2026)}{azar.randint(1, 12):02d}{azar.randint(1, 28):02d}",
+        )
+        if nombre not in usados:
+            usados.add(nombre)
+            return nombre + ".iso"
+
+
+def crear_usb(raiz, n_isos, n_iconos, n_claves, semilla):
+    """Crea <raiz>/<isos> y <raiz>/ventoy con Ventoy.Json, base_datos.json y un tema"""
+    azar = random.Random(semilla)
+    ventoy = os.path.join(raiz, "ventoy")
+    iconos = os.path.join(ventoy, "Themes", "bench", "icons")
+    os.makedirs(iconos)
+    os.makedirs(os.path.join(ventoy, "Themes", "bench2", "icons"))
+    for tema in ("bench", "bench2"):
+        with open(os.path.join(ventoy, "Themes", tema, "theme.txt"), "w", encoding="utf-8") as f:
+            f.write("title-text: \"\"\n")
+
+    nombres_iconos = ICONOS_REALES + [f"distro{i}" for i in range(max(0, n_iconos - len(ICONOS_REALES)))]
+    for tema in ("bench", "bench2"):
+        for icono in nombres_iconos[:n_iconos]:
+            open(os.path.join(ventoy, "Themes", tema, "icons", f"{icono}.png"), "wb").close()
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "base_datos.json"), encoding="utf-8") as f:
+        base = json.load(f)
+    for i in range(max(0, n_claves - len(base))):
+        base[f"distro{i}"] = [f"distro{i}"]
+    with open(os.path.join(ventoy, "base_datos.json"), "w", encoding="utf-8") as f:
+        json.dump(base, f, indent=4)
+
+    config = {"theme": {"file": "/Ventoy/Themes/bench/theme.txt"}, "menu_class": []}
+    with open(os.path.join(ventoy, "Ventoy.Json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=4)
+
+    usados = set()
+    isos = [generar_nombre_iso(azar, usados) for _ in range(n_isos)]
+    for iso in isos:
+        open(os.path.join(raiz, iso), "wb").close()
+    return ventoy, isos
+
+
+class ConfigBench(vcg.VentoyConfig):
+    """VentoyConfig silenciosa: sin ventanas ni mensajes"""
+
+    def mostrar_info(self, titulo, mensaje):
+        pass
+
+    def mostrar_aviso(self, titulo, mensaje):
+        pass
+
+
+def percentiles(muestras):
+    """Resumen de latencias en milisegundos"""
+    ordenadas = sorted(muestras)
+
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000
+
+    return {"p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99),
+            "max_ms": ordenadas[-1] * 1000, "media_ms": statistics.fmean(ordenadas) * 1000}
+
+
+def medir(nombre, preparar, operacion, elementos, repeticiones):
+    """Mide tiempo (sin tracemalloc) y luego memoria pico (con tracemalloc) de una etapa"""
+    latencias = []
+    total = 0.0
+    # Los mensajes de progreso del programa no forman parte de la medición
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeticiones):
+            argumentos = preparar()
+            inicio = time.perf_counter()
+            for elemento in elementos:
+                t = time.perf_counter()
+                operacion(argumentos, elemento)
+                latencias.append(time.perf_counter() - t)
+            total += time.perf_counter() - inicio
+
+        argumentos = preparar()
+        tracemalloc.start()
+        for elemento in elementos:
+            operacion(argumentos, elemento)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    operaciones = len(elementos) * repeticiones
+    resultado = {"operaciones": operaciones, "segundos": total,
+                 "por_segundo": operaciones / total if total else None,
+                 "memoria_pico_kib": pico / 1024}
+    resultado.update(percentiles(latencias))
+    print(f"{nombre:<28} {resultado['por_segundo'] or 0:>12.1f} op/s  p50 {resultado['p50_ms']:.3f} ms  "
+          f"p95 {resultado['p95_ms']:.3f} ms  pico {resultado['memoria_pico_kib']:.0f} KiB")
+    return resultado
+
+
+def medir_arranque(opcion, repeticiones):
+    """Tiempo de reloj de `python ventoy_config_gui.py <opcion>` frente a OBJETIVO_ARRANQUE_MS"""
+    comando = [sys.executable, os.path.abspath(vcg.__file__), opcion]
+    latencias = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        latencias.append(time.perf_counter() - inicio)
+    resultado = percentiles(latencias)
+    resultado["tkinter_importado"] = tkinter_importado(opcion)
+    resultado["objetivo_ms"] = vcg.OBJETIVO_ARRANQUE_MS
+    resultado["cumple_objetivo"] = resultado["p50_ms"] <= vcg.OBJETIVO_ARRANQUE_MS
+    print(f"arranque {opcion:<19} p50 {resultado['p50_ms']:.1f} ms  objetivo {vcg.OBJETIVO_ARRANQUE_MS} ms  "
+          f"{'OK' if resultado['cumple_objetivo'] else 'SUPERADO'}"
+          f"{'  (importó tkinter)' if resultado['tkinter_importado'] else ''}")
+    return resultado
+
+
+def tkinter_importado(opcion):
+    """Si `python ventoy_config_gui.py <opcion>` llega a importar tkinter (lo informa el subproceso)"""
+    codigo = ("import runpy, sys\n"
+              "sys.argv = [sys.argv[1], sys.argv[2]]\n"
+              "try:\n"
+              "    runpy.run_path(sys.argv[0], run_name='__main__')\n"
+              "except SystemExit:\n"
+              "    pass\n"
+              "print('TKINTER', 'tkinter' in sys.modules)\n")
+    salida = subprocess.run([sys.executable, "-c", codigo, os.path.abspath(vcg.__file__), opcion],
+                            capture_output=True, text=True, check=False).stdout
+    lineas = [l for l in salida.splitlines() if l.startswith("TKINTER ")]
+    return bool(lineas) and lineas[-1] == "TKINTER True"
+
+
+def medir_escalado(tamanos, semilla, repeticiones=3):
+    """Coste por ISO de calcular_isos_nuevas y la limpieza del menu_class para cada N.
+
+    El Ventoy.Json de cada N tiene entrada para el 99 % de las ISOs y un 1 % de entradas de
+    ISOs ya borradas, como uno real; no se toca el disco (la lista de ISOs se inyecta)."""
+    azar = random.Random(semilla)
+    usados = set()
+    todas = [generar_nombre_iso(azar, usados) for _ in range(max(tamanos))]
+    resultados = {}
+    for n in tamanos:
+        archivos = todas[:n]
+        entradas = [{"key": vcg.clave_iso(a), "class": "unknown"} for a in archivos[:n - n // 100]]
+        entradas += [{"key": f"borrada-{i}", "class": "unknown"} for i in range(n // 100)]
+        mejor = None
+        for _ in range(repeticiones):
+            app = ConfigBench()
+            app._isos = archivos
+            config = {"menu_class": list(entradas)}
+            inicio = time.perf_counter()
+            app.calcular_isos_nuevas(config, archivos)
+            menu_class = app.obtener_menu_class(config)
+            menu_class.conservar(vcg.clave_iso(a) for a in archivos)
+            app.guardar_menu_class(config, menu_class)
+            segundos = time.perf_counter() - inicio
+            mejor = segundos if mejor is None else min(mejor, segundos)
+        resultados[n] = mejor / n * 1e6
+        print(f"escalado {n:>8} ISOs  {resultados[n]:8.2f} µs/ISO  total {mejor * 1000:.1f} ms")
+
+    referencia = resultados.get(REFERENCIA_ESCALADO) or resultados[min(tamanos)]
+    crecimiento = resultados[max(tamanos)] / referencia
+    cumple = crecimiento <= MAXIMO_CRECIMIENTO_ESCALADO
+    print(f"escalado coste por ISO x{crecimiento:.2f} (máximo x{MAXIMO_CRECIMIENTO_ESCALADO})  "
+          f"{'OK' if cumple else 'SUPERADO'}")
+    return {"us_por_iso": {str(n): v for n, v in resultados.items()}, "crecimiento": crecimiento,
+            "cumple_objetivo": cumple}
+
+
+def ejecutar(args):
+    raiz = tempfile.mkdtemp(prefix="ventoy_bench_")
+    directorio_original = os.getcwd()
+    try:
+        ventoy, isos = crear_usb(raiz, args.isos, args.iconos, args.claves, args.semilla)
+        os.chdir(ventoy)
+        nombres = [os.path.splitext(iso)[0] for iso in isos]
+        etapas = {}
+
+        def app_nueva():
+            return ConfigBench()
+
+        def preparar_deteccion():
+            app = ConfigBench()
+            return app, app.cargar_base_datos()
+
+        etapas["cargar_base_datos"] = medir(
+            "cargar_base_datos", lambda: None,
+            lambda _, __: ConfigBench().cargar_base_datos(), [None], args.repeticiones)
+
+        etapas["detectar_sistema_automatico"] = medir(
+            "detectar_sistema_automatico", preparar_deteccion,
+            lambda a, nombre: a[0].detectar_sistema_automatico(nombre, a[1]),
+            nombres, args.repeticiones)
+
+        def preparar_clasificador():
+            app, base = preparar_deteccion()
+            app.obtener_clasificador(base)
+            vcg.ngramas_nombre.cache_clear()
+            return app, base
+
+        etapas["clasificar_nombre"] = medir(
+            "clasificar_nombre", preparar_clasificador,
+            lambda a, nombre: a[0].clasificar_nombre(nombre, a[1]),
+            nombres, args.repeticiones)
+
+        def buscar_icono(a, nombre):
+            app, base = a
+            clave, _ = app.detectar_sistema_automatico(nombre, base)
+            app.buscar_icono_por_partes("bench", nombre, base[clave] if clave else [])
+
+        etapas["buscar_icono_por_partes"] = medir(
+            "buscar_icono_por_partes", preparar_deteccion, buscar_icono, nombres, args.repeticiones)
+
+        def limpiar_estado():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove("estado_escaneo.json")
+            with open("Ventoy.Json", "w", encoding="utf-8") as f:
+                json.dump({"theme": {"file": "/Ventoy/Themes/bench/theme.txt"}, "menu_class": []}, f)
+            return app_nueva()
+
+        def actualizar(app, _):
+            base = app.cargar_base_datos()
+            config, ruta = app.cargar_ventoy_json()
+            app.actualizar_json(config, app.calcular_isos_nuevas(config, app.listar_isos()), "bench", base, ruta)
+
+        def rescanear(app, _):
+            base = app.cargar_base_datos()
+            config, ruta = app.cargar_ventoy_json()
+            app.rescanear_iconos_tema(config, "bench2", base, ruta)
+
+        def preparar_rescaneo():
+            with contextlib.redirect_stdout(io.StringIO()):
+                actualizar(limpiar_estado(), None)
+            return app_nueva()
+
+        etapas["actualizar_json"] = medir(
+            "actualizar_json", limpiar_estado, actualizar, [None], args.repeticiones)
+        etapas["rescanear_iconos_tema"] = medir(
+            "rescanear_iconos_tema", preparar_rescaneo, rescanear, [None], args.repeticiones)
+        # Segunda pasada: todo sale del estado de escaneo
+        etapas["rescanear_sin_cambios"] = medir(
+            "rescanear_sin_cambios", app_nueva, rescanear, [None], args.repeticiones)
+        for nombre in ("actualizar_json", "rescanear_iconos_tema", "rescanear_sin_cambios"):
+            e = etapas[nombre]
+            print(f"{nombre:<28} {len(isos) / (e['media_ms'] / 1000):>12.1f} ISO/s  "
+                  f"media {e['media_ms']:.1f} ms  pico {e['memoria_pico_kib']:.0f} KiB")
+
+        # Arranque en frío de las operaciones de solo lectura (proceso completo)
+        for opcion in ("--estado", "--validar"):
+            etapas[f"arranque{opcion.replace('--', '_')}"] = medir_arranque(opcion, args.repeticiones)
+        etapas["tkinter_importado"] = any(etapas[f"arranque_{opcion}"]["tkinter_importado"]
+                                          for opcion in ("estado", "validar"))
+
+        if args.escalado:
+            etapas["escalado"] = medir_escalado(args.escalado, args.semilla)
+    finally:
+        os.chdir(directorio_original)
+        shutil.rmtree(raiz, ignore_errors=True)
+
+    return {
+        "parametros": {"isos": args.isos, "iconos": args.iconos, "claves": args.claves,
+                       "repeticiones": args.repeticiones, "semilla": args.semilla},
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform(),
+                    "procesador": platform.machine()},
+        "etapas": etapas,
+    }
+
+
+def comparar(actual, ruta_anterior):
+    """Muestra la variación de la mediana de cada etapa respecto a un resultado guardado"""
+    with open(ruta_anterior, encoding="utf-8") as f:
+        anterior = json.load(f)
+    if anterior.get("parametros") != actual["parametros"]:
+        print("Aviso: los parámetros difieren del resultado anterior", file=sys.stderr)
+    print(f"\nComparación con {ruta_anterior} (mediana):")
+    for nombre, etapa in actual["etapas"].items():
+        previa = anterior.get("etapas", {}).get(nombre)
+        if not isinstance(etapa, dict) or not previa or not previa.get("p50_ms"):
+            continue
+        cambio = (etapa["p50_ms"] / previa["p50_ms"] - 1) * 100
+        print(f"  {nombre:<28} {previa['p50_ms']:.3f} -> {etapa['p50_ms']:.3f} ms ({cambio:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de detección e iconos sobre un USB sintético")
+    parser.add_argument("--isos", type=int, default=300, help="número de ISOs (N)")
+    parser.add_argument("--iconos", type=int, default=200, help="iconos en el tema (M)")
+    parser.add_argument("--claves", type=int, default=1000, help="claves en base_datos (K)")
+    parser.add_argument("--repeticiones", type=int, default=5, help="repeticiones de cada etapa")
+    parser.add_argument("--semilla", type=int, default=1, help="semilla de los nombres generados")
+    parser.add_argument("--escalado", type=lambda v: tuple(int(n) for n in v.split(",") if n),
+                        default=TAMANOS_ESCALADO, metavar="N,N,...",
+                        help="tamaños del test de escalado lineal de menu_class ('' para omitirlo)")
+    parser.add_argument("--salida", help="guardar los resultados en este archivo JSON")
+    parser.add_argument("--comparar", help="resultado JSON anterior con el que comparar")
+    args = parser.parse_args()
+
+    resultados = ejecutar(args)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=4)
+        print(f"Resultados guardados en {args.salida}")
+    if args.comparar:
+        comparar(resultados, args.comparar)
+    etapas = resultados["etapas"]
+    fallidas = [nombre for nombre in ("escalado", "arranque_estado", "arranque_validar")
+                if nombre in etapas and not etapas[nombre]["cumple_objetivo"]]
+    if etapas.get("tkinter_importado"):
+        fallidas.append("tkinter_importado")
+    if fallidas:
+        print(f"Objetivos no cumplidos: {', '.join(fallidas)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
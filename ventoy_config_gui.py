@@ -1,290 +1,3018 @@
+import argparse
+import base64
+import bisect
+import contextlib
+import fnmatch
+import functools
 import glob
 import os
 import json
+import math
+import mmap
 import re
-import shutil
-import tkinter as tk
-from tkinter import filedialog, simpledialog, messagebox, ttk
+import stat
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+
+# Objetivo de arranque (ms de reloj, proceso completo) para --estado y --validar; lo mide benchmark.py.
+# Línea base medida: p50 de 120 a 155 ms, de los que unos 85 ms son compilar este archivo (un script
+# ejecutado directamente no usa .pyc); el margen cubre el ruido de la medida
+OBJETIVO_ARRANQUE_MS = 250
+
+# tkinter solo se importa al abrir la interfaz gráfica (ver importar_tkinter)
+tk = filedialog = simpledialog = messagebox = ttk = None
+
+def importar_tkinter():
+    """Carga tkinter la primera vez que se necesita una ventana"""
+    global tk, filedialog, simpledialog, messagebox, ttk
+    if tk is None:
+        import tkinter
+        from tkinter import filedialog, simpledialog, messagebox, ttk
+        tk = tkinter
+
+def escribir_json_atomico(ruta, datos, indent=4):
+    """Escribe el JSON vía archivo temporal + fsync + rename; no toca el archivo si no cambia"""
+    contenido = json.dumps(datos, indent=indent)
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            if f.read() == contenido:
+                return False
+    except (OSError, ValueError):
+        pass
+    reemplazar_atomico(ruta, contenido)
+    return True
+
+def reemplazar_atomico(ruta, contenido):
+    """Sustituye el archivo por el contenido (str o bytes) sin dejarlo a medias"""
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    temporal = os.path.join(directorio, f".{os.path.basename(ruta)}.tmp")
+    try:
+        with (open(temporal, "wb") if isinstance(contenido, bytes)
+              else open(temporal, "w", encoding="utf-8")) as f:
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        # Un USB retirado a mitad de escritura deja el original intacto
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+
+    # Persistir también la entrada del directorio (solo POSIX)
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            fd = os.open(directorio, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+# Métodos que mide --traza y qué tiempo representan: "es" (disco), "calculo" o "dialogo"
+# (espera al usuario con interfaz gráfica; sin ella la política responde al instante)
+ETAPAS_TRAZA = {
+    "cargar_base_datos": "es", "cargar_ventoy_json": "es", "listar_isos": "es",
+    "obtener_indice_iconos": "es", "detectar_por_contenido": "es",
+    "guardar_base_datos": "es", "guardar_cambios": "es",
+    "detectar_sistema_automatico": "calculo", "clasificar_nombre": "calculo", "puntuar_iconos": "calculo",
+    "buscar_icono_por_partes": "calculo", "resolver_isos": "calculo", "resolver_iso": "calculo",
+    "registrar_resoluciones": "calculo",
+    "revisar_resoluciones": "dialogo", "preguntar_sistema_operativo": "dialogo",
+    "elegir_icono_usuario": "dialogo", "gestionar_icono_faltante": "dialogo",
+    "copiar_icono_manual": "dialogo", "preguntar_si": "dialogo", "seleccionar_tema": "dialogo",
+    "mostrar_menu_principal": "dialogo",
+    "mostrar_info": "dialogo", "mostrar_aviso": "dialogo", "mostrar_error": "dialogo",
+}
+
+# Llamadas al sistema de archivos que cuenta --traza en cada etapa
+LLAMADAS_FS = ("stat", "lstat", "scandir", "listdir", "replace", "fsync")
+
+class Traza:
+    """Traza JSON-lines de tiempos por etapa, espera del usuario y llamadas al disco"""
+
+    def __init__(self, ruta):
+        import builtins
+        self._archivo = open(ruta, "w", encoding="utf-8")
+        self._bloqueo = threading.Lock()
+        self._local = threading.local()
+        self._contadores = []         # Contadores de cada hilo, para el total
+        self._etapas = {}
+        self._inicio = time.perf_counter()
+        self._en_etapas = 0.0         # Tiempo del hilo principal dentro de alguna etapa
+        self._hilo_principal = threading.main_thread()
+        self._threading = threading
+        self._originales = []
+        self._parchear(builtins, "open", "open")
+        for nombre in LLAMADAS_FS:
+            self._parchear(os, nombre, nombre)
+
+    def _parchear(self, modulo, atributo, contador):
+        """Sustituye una función por otra que cuenta sus llamadas en el hilo actual"""
+        original = getattr(modulo, atributo)
+
+        @functools.wraps(original)
+        def contada(*args, **kwargs):
+            contadores = self._contadores_hilo()
+            contadores[contador] = contadores.get(contador, 0) + 1
+            return original(*args, **kwargs)
+
+        self._originales.append((modulo, atributo, original))
+        setattr(modulo, atributo, contada)
+
+    def _contadores_hilo(self):
+        contadores = getattr(self._local, "contadores", None)
+        if contadores is None:
+            contadores = self._local.contadores = {}
+            with self._bloqueo:
+                self._contadores.append(contadores)
+        return contadores
+
+    def instrumentar(self, app):
+        """Envuelve los métodos de ETAPAS_TRAZA de la instancia (incluidas las redefiniciones)"""
+        interactivo = isinstance(app, VentoyConfigGUI)
+        for nombre, clase in ETAPAS_TRAZA.items():
+            metodo = getattr(app, nombre, None)
+            if metodo is None:
+                continue
+            if clase == "dialogo":
+                clase = "usuario" if interactivo else "calculo"
+            setattr(app, nombre, self.envolver(metodo, nombre, clase))
+        # Las escrituras de JSON (Ventoy.Json, base, estado, catálogo) pasan todas por aquí
+        modulo = sys.modules[__name__]
+        self._originales.append((modulo, "escribir_json_atomico", escribir_json_atomico))
+        modulo.escribir_json_atomico = self.envolver(escribir_json_atomico, "escribir_json_atomico", "es")
+
+    def envolver(self, funcion, nombre, clase):
+        @functools.wraps(funcion)
+        def medida(*args, **kwargs):
+            with self.etapa(nombre, clase):
+                return funcion(*args, **kwargs)
+        return medida
+
+    @contextlib.contextmanager
+    def etapa(self, nombre, clase):
+        """Mide una etapa; el tiempo de las etapas anidadas se descuenta del propio"""
+        pila = getattr(self._local, "pila", None)
+        if pila is None:
+            pila = self._local.pila = []
+        contadores = self._contadores_hilo()
+        antes = dict(contadores)
+        marco = {"hijos": 0.0}
+        pila.append(marco)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            pila.pop()
+            if pila:
+                pila[-1]["hijos"] += duracion
+            elif self._threading.current_thread() is self._hilo_principal:
+                self._en_etapas += duracion
+            fs = {k: v - antes.get(k, 0) for k, v in contadores.items() if v != antes.get(k, 0)}
+            self._registrar(nombre, clase, inicio, duracion, duracion - marco["hijos"], len(pila), fs)
+
+    def _registrar(self, nombre, clase, inicio, duracion, propio, nivel, fs):
+        registro = {"tipo": "etapa", "etapa": nombre, "clase": clase,
+                    "inicio_ms": round((inicio - self._inicio) * 1000, 3),
+                    "ms": round(duracion * 1000, 3), "propio_ms": round(propio * 1000, 3),
+                    "hilo": self._threading.current_thread().name, "nivel": nivel, "fs": fs}
+        with self._bloqueo:
+            total = self._etapas.setdefault(nombre, {"clase": clase, "veces": 0, "ms": 0.0, "propio_ms": 0.0, "fs": {}})
+            total["veces"] += 1
+            total["ms"] += duracion * 1000
+            total["propio_ms"] += propio * 1000
+            for k, v in fs.items():
+                total["fs"][k] = total["fs"].get(k, 0) + v
+            self._archivo.write(json.dumps(registro) + "\n")
+
+    def cerrar(self):
+        """Restaura las funciones originales y escribe el resumen final"""
+        for modulo, atributo, original in reversed(self._originales):
+            setattr(modulo, atributo, original)
+        total_ms = (time.perf_counter() - self._inicio) * 1000
+        por_clase = {}
+        fs = {}
+        for datos in self._etapas.values():
+            por_clase[datos["clase"]] = por_clase.get(datos["clase"], 0.0) + datos["propio_ms"]
+        for contadores in self._contadores:
+            for k, v in contadores.items():
+                fs[k] = fs.get(k, 0) + v
+        resumen = {"tipo": "resumen", "total_ms": round(total_ms, 3),
+                   "fuera_de_etapas_ms": round(total_ms - self._en_etapas * 1000, 3),
+                   "por_clase_ms": {k: round(v, 3) for k, v in por_clase.items()},
+                   "etapas": {k: dict(v, ms=round(v["ms"], 3), propio_ms=round(v["propio_ms"], 3))
+                              for k, v in self._etapas.items()},
+                   "fs": fs}
+        with self._bloqueo:
+            self._archivo.write(json.dumps(resumen) + "\n")
+            self._archivo.close()
+        print(f"Traza: {total_ms:.0f} ms en total; " +
+              ", ".join(f"{k} {v:.0f} ms" for k, v in sorted(por_clase.items())), file=sys.stderr)
+
+SECTOR_ISO = 2048
+
+def _texto_iso(vista, inicio, largo, codificacion="ascii"):
+    """Decodifica un campo de texto de un descriptor ISO9660 (rellenado con espacios)"""
+    if inicio + largo > len(vista):
+        return ""
+    return str(vista[inicio:inicio + largo], codificacion, "replace").strip(" \x00")
+
+def _dstring_udf(vista, inicio, largo):
+    """Decodifica un dstring UDF (OSTA CS0 comprimido, longitud en el último byte)"""
+    if inicio + largo > len(vista):
+        return ""
+    usados = vista[inicio + largo - 1]
+    if usados < 2 or usados >= largo:
+        return ""
+    compresion = vista[inicio]
+    datos = vista[inicio + 1:inicio + usados]
+    if compresion == 8:
+        return str(datos, "latin-1").strip()
+    if compresion == 16:
+        return str(datos, "utf-16-be", "replace").strip()
+    return ""
+
+def leer_etiquetas_iso(ruta):
+    """Lee etiquetas de volumen ISO9660/Joliet/UDF/El Torito sin recorrer la imagen"""
+    try:
+        with open(ruta, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                with memoryview(mapa) as vista:
+                    return _leer_descriptores_iso(vista, {})
+    except (OSError, ValueError):
+        # Archivo vacío, sin permisos o que no es una imagen ISO
+        return {}
+
+# Bytes del principio y del final de la imagen que entran en su huella
+BLOQUE_HUELLA = 4 * 1024 * 1024
+
+def huella_iso(ruta, bloque=BLOQUE_HUELLA):
+    """Identidad barata de una imagen: tamaño + hash del primer y último bloque"""
+    import hashlib
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta, "rb") as f:
+        tamano = os.fstat(f.fileno()).st_size
+        if tamano:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                with memoryview(mapa) as vista:
+                    if tamano <= 2 * bloque:
+                        h.update(vista)
+                    else:
+                        h.update(vista[:bloque])
+                        h.update(vista[-bloque:])
+    return f"{tamano}-{h.hexdigest()}"
+
+def _leer_descriptores_iso(vista, etiquetas):
+    """Recorre el conjunto de descriptores de volumen a partir del sector 16"""
+    es_udf = False
+    catalogo_arranque = None
+    for sector in range(16, 64):
+        inicio = sector * SECTOR_ISO
+        descriptor = vista[inicio:inicio + SECTOR_ISO]
+        if len(descriptor) < SECTOR_ISO:
+            break
+        tipo, identificador = descriptor[0], bytes(descriptor[1:6])
+        if identificador in (b"NSR02", b"NSR03"):
+            es_udf = True
+        elif identificador == b"CD001":
+            if tipo == 1:
+                etiquetas["sistema"] = _texto_iso(descriptor, 8, 32)
+                etiquetas["volumen"] = _texto_iso(descriptor, 40, 32)
+                etiquetas["editor"] = _texto_iso(descriptor, 318, 128)
+                etiquetas["aplicacion"] = _texto_iso(descriptor, 574, 128)
+            elif tipo == 2 and bytes(descriptor[88:91]) in (b"%/@", b"%/C", b"%/E"):
+                # Descriptor suplementario Joliet: UCS-2, conserva mayúsculas y espacios
+                etiquetas["volumen_joliet"] = _texto_iso(descriptor, 40, 32, "utf-16-be")
+            elif tipo == 0 and bytes(descriptor[7:30]) == b"EL TORITO SPECIFICATION":
+                catalogo_arranque = struct.unpack_from("<I", descriptor, 71)[0]
+            elif tipo == 255:
+                # Terminador ISO9660; la secuencia UDF (BEA01/NSR0x) puede venir después
+                continue
+        elif identificador not in (b"BEA01", b"TEA01"):
+            break
+
+    if catalogo_arranque:
+        inicio = catalogo_arranque * SECTOR_ISO
+        entrada = vista[inicio:inicio + 32]
+        if len(entrada) == 32 and entrada[0] == 1:
+            etiquetas["el_torito"] = _texto_iso(entrada, 4, 24)
+
+    if es_udf:
+        _leer_udf(vista, etiquetas)
+
+    return {k: v for k, v in etiquetas.items() if v}
+
+def _leer_udf(vista, etiquetas):
+    """Lee los identificadores de volumen UDF a partir del ancla del sector 256"""
+    ancla = 256 * SECTOR_ISO
+    if ancla + 24 > len(vista) or struct.unpack_from("<H", vista, ancla)[0] != 2:
+        return
+    largo, ubicacion = struct.unpack_from("<II", vista, ancla + 16)
+    for sector in range(ubicacion, ubicacion + min(largo // SECTOR_ISO, 32)):
+        inicio = sector * SECTOR_ISO
+        if inicio + SECTOR_ISO > len(vista):
+            break
+        etiqueta = struct.unpack_from("<H", vista, inicio)[0]
+        if etiqueta == 1:
+            etiquetas["volumen_udf"] = _dstring_udf(vista, inicio + 24, 32)
+        elif etiqueta == 6:
+            etiquetas["volumen_logico_udf"] = _dstring_udf(vista, inicio + 84, 128)
+        elif etiqueta == 8:
+            break
+
+# Imágenes que Ventoy puede arrancar
+EXTENSIONES_IMAGEN = (".iso", ".wim", ".img", ".vhd", ".vhdx", ".efi", ".vtoy")
+EXCLUIR_POR_DEFECTO = ("ventoy", "System Volume Information", "$RECYCLE.BIN", ".*")
+
+def clave_iso(archivo):
+    """Clave de menu_class de una imagen: Ventoy compara con el nombre, no con la carpeta"""
+    return os.path.splitext(archivo.rsplit("/", 1)[-1])[0]
+
+def _excluida(ruta_relativa, excluir):
+    nombre = ruta_relativa.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(nombre, patron) or fnmatch.fnmatch(ruta_relativa, patron)
+               for patron in excluir)
+
+def recorrer_imagenes(raiz, extensiones=EXTENSIONES_IMAGEN, excluir=EXCLUIR_POR_DEFECTO,
+                      directorios=None, prefijo=""):
+    """Recorre el USB con os.scandir y va devolviendo (ruta relativa, stat) de cada imagen"""
+    extensiones = tuple(e.lower() for e in extensiones)
+    pila = [prefijo]
+    while pila:
+        relativa = pila.pop()
+        carpeta = os.path.join(raiz, relativa) if relativa else raiz
+        try:
+            with os.scandir(carpeta) as iterador:
+                entradas = list(iterador)
+        except OSError:
+            continue
+        # Ventoy no muestra las carpetas que contienen un archivo .ventoyignore
+        if relativa and any(e.name == ".ventoyignore" for e in entradas):
+            continue
+        if directorios is not None:
+            directorios.append(carpeta)
+        subcarpetas = []
+        for entrada in entradas:
+            ruta = f"{relativa}/{entrada.name}" if relativa else entrada.name
+            if _excluida(ruta, excluir):
+                continue
+            try:
+                if entrada.is_dir(follow_symlinks=False):
+                    subcarpetas.append(ruta)
+                elif entrada.name.lower().endswith(extensiones) and entrada.is_file():
+                    yield ruta, entrada.stat()
+            except OSError:
+                continue
+        pila.extend(reversed(subcarpetas))
+
+class VigilanteSondeo:
+    """Detecta cambios en carpetas comparando listados periódicos (sin inotify)"""
+
+    def __init__(self, directorios):
+        self.directorios = list(directorios)
+        self._fotos = {d: self._foto(d) for d in self.directorios}
+
+    @staticmethod
+    def _foto(directorio):
+        foto = {}
+        try:
+            with os.scandir(directorio) as entradas:
+                for entrada in entradas:
+                    try:
+                        info = entrada.stat()
+                    except OSError:
+                        continue
+                    foto[entrada.name] = (info.st_size, info.st_mtime_ns)
+        except OSError:
+            pass
+        return foto
+
+    def esperar(self, intervalo):
+        """Espera el intervalo y devuelve {(directorio, nombre)} de lo que cambió"""
+        time.sleep(intervalo)
+        cambios = set()
+        for directorio in self.directorios:
+            anterior, actual = self._fotos[directorio], self._foto(directorio)
+            for nombre in set(anterior) | set(actual):
+                if anterior.get(nombre) != actual.get(nombre):
+                    cambios.add((directorio, nombre))
+            self._fotos[directorio] = actual
+        return cambios
+
+    def agregar(self, directorio):
+        if directorio not in self._fotos:
+            self.directorios.append(directorio)
+            self._fotos[directorio] = self._foto(directorio)
+
+    def cerrar(self):
+        pass
+
+class VigilanteInotify:
+    """Eventos de inotify (Linux) leídos con ctypes, sin dependencias externas"""
+
+    # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE; sin IN_MODIFY: cada
+    # escritura de una copia de varios GB sería un evento, y el tamaño estable ya se sondea con stat
+    MASCARA = 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+    IN_Q_OVERFLOW = 0x4000
+    DESBORDADO = (None, None)  # Se perdieron eventos: hay que volver a listar las imágenes
+    EVENTO = struct.Struct("iIII")
+
+    def __init__(self, directorios):
+        import ctypes
+        import ctypes.util
+        import select
+        self._select = select
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._libc = libc
+        self._directorios = {}
+        for directorio in directorios:
+            self.agregar(directorio)
+
+    def agregar(self, directorio):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directorio), self.MASCARA)
+        if wd >= 0:
+            self._directorios[wd] = directorio
+
+    def esperar(self, intervalo):
+        """Espera eventos hasta el intervalo y devuelve {(directorio, nombre)}"""
+        cambios = set()
+        listos, _, _ = self._select.select([self.fd], [], [], intervalo)
+        if not listos:
+            return cambios
+        try:
+            datos = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return cambios
+        posicion = 0
+        while posicion + self.EVENTO.size <= len(datos):
+            wd, mascara, _, largo = self.EVENTO.unpack_from(datos, posicion)
+            posicion += self.EVENTO.size
+            nombre = os.fsdecode(datos[posicion:posicion + largo].rstrip(b"\x00"))
+            posicion += largo
+            if wd == -1 or mascara & self.IN_Q_OVERFLOW:
+                cambios.add(self.DESBORDADO)
+            elif wd in self._directorios and nombre:
+                cambios.add((self._directorios[wd], nombre))
+        return cambios
+
+    def cerrar(self):
+        os.close(self.fd)
+
+def crear_vigilante(directorios):
+    """inotify si está disponible; si no, sondeo periódico de las carpetas"""
+    if sys.platform.startswith("linux"):
+        try:
+            return VigilanteInotify(directorios)
+        except (OSError, AttributeError):
+            pass
+    return VigilanteSondeo(directorios)
+
+class IndiceDeteccion:
+    """Autómata Aho-Corasick sobre las claves y valores de la base de datos"""
+
+    def __init__(self, base):
+        self.base = base
+        self.reconstruir()
+
+    def reconstruir(self):
+        """Construye el autómata completo a partir de la base"""
+        self._hijos = [{}]
+        self._fallo = [0]
+        self._propios = [None]  # Menor rango de patrón que termina en el nodo
+        self._minimo = [None]   # Menor rango alcanzable siguiendo los enlaces de fallo
+        self._resultados = []   # rango -> (clave, valor)
+        self._rangos_clave = {}
+        for clave, valores in self.base.items():
+            self._insertar_clave(clave, valores)
+        self._calcular_fallos()
+
+    def agregar(self, clave):
+        """Incorpora una clave nueva de la base sin reconstruir todo el autómata"""
+        if clave in self._rangos_clave:
+            # La clave ya existía con otros valores: sus rangos quedan obsoletos
+            self.reconstruir()
+            return
+        self._insertar_clave(clave, self.base[clave])
+        self._pendiente = True
+
+    def _insertar_clave(self, clave, valores):
+        """Inserta la clave y sus valores respetando el orden de prioridad actual"""
+        # Mismo orden que el recorrido lineal: la clave primero y luego cada valor
+        patrones = [(clave, (clave, valores[0] if valores else None))]
+        patrones += [(valor, (clave, valor)) for valor in valores]
+        rangos = []
+        for patron, resultado in patrones:
+            rango = len(self._resultados)
+            self._resultados.append(resultado)
+            rangos.append(rango)
+            nodo = 0
+            for caracter in patron:
+                siguiente = self._hijos[nodo].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self._hijos)
+                    self._hijos.append({})
+                    self._fallo.append(0)
+                    self._propios.append(None)
+                    self._minimo.append(None)
+                    self._hijos[nodo][caracter] = siguiente
+                nodo = siguiente
+            if self._propios[nodo] is None:
+                self._propios[nodo] = rango
+        self._rangos_clave[clave] = rangos
+
+    def _calcular_fallos(self):
+        """Calcula los enlaces de fallo y el menor rango de cada nodo (BFS)"""
+        self._minimo[0] = self._propios[0]
+        cola = []
+        for hijo in self._hijos[0].values():
+            self._fallo[hijo] = 0
+            cola.append(hijo)
+        for nodo in cola:
+            self._minimo[nodo] = self._menor(self._propios[nodo], self._minimo[self._fallo[nodo]])
+            for caracter, hijo in self._hijos[nodo].items():
+                fallo = self._fallo[nodo]
+                while fallo and caracter not in self._hijos[fallo]:
+                    fallo = self._fallo[fallo]
+                destino = self._hijos[fallo].get(caracter, 0)
+                self._fallo[hijo] = destino if destino != hijo else 0
+                cola.append(hijo)
+        self._pendiente = False
+
+    @staticmethod
+    def _menor(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return min(a, b)
+
+    def buscar(self, nombre_lower):
+        """Devuelve (clave, valor) del patrón de mayor prioridad contenido en el nombre"""
+        if self._pendiente:
+            self._calcular_fallos()
+        hijos, fallo, minimo = self._hijos, self._fallo, self._minimo
+        mejor = minimo[0]
+        nodo = 0
+        for caracter in nombre_lower:
+            while nodo and caracter not in hijos[nodo]:
+                nodo = fallo[nodo]
+            nodo = hijos[nodo].get(caracter, 0)
+            rango = minimo[nodo]
+            if rango is not None and (mejor is None or rango < mejor):
+                mejor = rango
+        if mejor is None:
+            return None, None
+        return self._resultados[mejor]
+
+# Índice binario de base_datos.json: cabecera, tabla de secciones y secciones alineadas a 8 bytes
+MAGIA_INDICE = b"VTYBDX"
+VERSION_INDICE = 1
+CABECERA_INDICE = struct.Struct("<6sHB7xQq16s")  # magia, versión, little endian, tamaño, mtime, hash
+SECCION_INDICE = struct.Struct("<QQ")             # desplazamiento, largo
+SECCIONES_INDICE = (
+    "cadenas_inicio", "cadenas",                  # cadenas internadas (UTF-8)
+    "claves", "valores_inicio", "valores",        # entradas en el orden del JSON
+    "orden",                                      # entradas ordenadas por clave (búsqueda binaria)
+    "hijos_inicio", "hijos_caracter", "hijos_destino", "fallo", "minimo",  # autómata
+    "resultado_entrada", "resultado_valor",       # rango -> (entrada, valor)
+)
+TIPOS_SECCION = {"cadenas": "B", "minimo": "i"}  # El resto son "I"
+NINGUNO = 0xFFFFFFFF
+
+def firma_base(ruta_json):
+    """Hash del contenido de base_datos.json"""
+    import hashlib
+    with open(ruta_json, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).digest()
+
+def compilar_base(base, info, firma):
+    """Serializa la base (cadenas, entradas y autómata Aho-Corasick) al formato del índice"""
+    cadenas = {}
+
+    def internar(texto):
+        if texto is None:
+            return NINGUNO
+        if texto not in cadenas:
+            cadenas[texto] = len(cadenas)
+        return cadenas[texto]
+
+    claves = list(base)
+    secciones = {nombre: array(TIPOS_SECCION.get(nombre, "I")) for nombre in SECCIONES_INDICE}
+    secciones["claves"].extend(internar(clave) for clave in claves)
+    secciones["valores_inicio"].append(0)
+    for clave in claves:
+        secciones["valores"].extend(internar(valor) for valor in base[clave])
+        secciones["valores_inicio"].append(len(secciones["valores"]))
+    secciones["orden"].extend(sorted(range(len(claves)), key=claves.__getitem__))
+
+    indice = IndiceDeteccion(base)
+    secciones["hijos_inicio"].append(0)
+    for hijos in indice._hijos:
+        for caracter, hijo in sorted(hijos.items()):
+            secciones["hijos_caracter"].append(ord(caracter))
+            secciones["hijos_destino"].append(hijo)
+        secciones["hijos_inicio"].append(len(secciones["hijos_caracter"]))
+    secciones["fallo"].extend(indice._fallo)
+    secciones["minimo"].extend(-1 if m is None else m for m in indice._minimo)
+    entradas = {clave: i for i, clave in enumerate(claves)}
+    for clave, valor in indice._resultados:
+        secciones["resultado_entrada"].append(entradas[clave])
+        secciones["resultado_valor"].append(internar(valor))
+
+    datos = bytearray()
+    secciones["cadenas_inicio"].append(0)
+    for texto in cadenas:  # En orden de internado
+        datos += texto.encode("utf-8")
+        secciones["cadenas_inicio"].append(len(datos))
+    secciones["cadenas"].frombytes(bytes(datos))
+
+    cabecera = CABECERA_INDICE.pack(MAGIA_INDICE, VERSION_INDICE, sys.byteorder == "little",
+                                    info.st_size, info.st_mtime_ns, firma)
+    desplazamiento = CABECERA_INDICE.size + SECCION_INDICE.size * len(SECCIONES_INDICE)
+    tabla, cuerpo = [], []
+    for nombre in SECCIONES_INDICE:
+        desplazamiento += -desplazamiento % 8
+        contenido = secciones[nombre].tobytes()
+        tabla.append(SECCION_INDICE.pack(desplazamiento, len(contenido)))
+        cuerpo.append((desplazamiento, contenido))
+        desplazamiento += len(contenido)
+    salida = bytearray(cabecera + b"".join(tabla))
+    for inicio, contenido in cuerpo:
+        salida += bytes(inicio - len(salida)) + contenido
+    return bytes(salida)
+
+def guardar_indice_base(ruta_json, ruta_indice, base):
+    """Reescribe el índice binario a partir de la base ya escrita en ruta_json"""
+    reemplazar_atomico(ruta_indice, compilar_base(base, os.stat(ruta_json), firma_base(ruta_json)))
+
+def cargar_base_compilada(ruta_json="base_datos.json", ruta_indice="base_datos.idx", escribir=True):
+    """Base mapeada desde el índice; lo (re)compila si cambió el hash del JSON.
+
+    Si el índice no se puede (o no se debe, escribir=False) escribir se usa compilado en memoria;
+    si no se puede compilar, devuelve el dict leído del JSON. Lanza FileNotFoundError si no
+    existe el JSON.
+    """
+    info = os.stat(ruta_json)
+    try:
+        with open(ruta_indice, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magia, version, little, tamano, mtime, firma = CABECERA_INDICE.unpack_from(mapa, 0)
+        if magia == MAGIA_INDICE and version == VERSION_INDICE and little == (sys.byteorder == "little"):
+            if (tamano, mtime) == (info.st_size, info.st_mtime_ns):
+                return BaseCompilada(mapa)
+            if firma == firma_base(ruta_json):
+                # Mismo contenido con otra fecha (copiado a otro USB): solo se actualiza la cabecera
+                try:
+                    if escribir:
+                        with open(ruta_indice, "r+b") as f:
+                            f.write(CABECERA_INDICE.pack(magia, version, little, info.st_size,
+                                                         info.st_mtime_ns, firma))
+                except OSError:
+                    pass  # Solo lectura: el índice sigue valiendo, se vuelve a comprobar la firma
+                return BaseCompilada(mapa)
+        mapa.close()
+    except (OSError, ValueError, struct.error):
+        pass
+
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    try:
+        datos = compilar_base(base, info, firma_base(ruta_json))
+    except (ValueError, struct.error):
+        return base
+    try:
+        if escribir:
+            reemplazar_atomico(ruta_indice, datos)
+    except OSError:
+        pass  # USB de solo lectura: el índice se usa solo en memoria
+    return BaseCompilada(datos)
+
+class BaseCompilada(MutableMapping):
+    """base_datos.json servida desde el índice mapeado en memoria; los cambios quedan aparte"""
+
+    def __init__(self, mapa):
+        self._mapa = mapa
+        vista = memoryview(mapa)
+        posicion = CABECERA_INDICE.size
+        for nombre in SECCIONES_INDICE:
+            inicio, largo = SECCION_INDICE.unpack_from(vista, posicion)
+            posicion += SECCION_INDICE.size
+            setattr(self, f"_{nombre}", vista[inicio:inicio + largo].cast(TIPOS_SECCION.get(nombre, "I")))
+        self._entradas = len(self._claves)
+        self._cambios = {}       # Claves nuevas o modificadas en esta ejecución
+        self._borradas = set()
+        self._nuevas = 0         # Claves de _cambios que no están en el índice
+        self.indice = IndiceCompilado(self)
+
+    def _cadena(self, i):
+        if i == NINGUNO:
+            return None
+        return str(self._cadenas[self._cadenas_inicio[i]:self._cadenas_inicio[i + 1]], "utf-8")
+
+    def _valores_entrada(self, entrada):
+        return [self._cadena(v) for v in self._valores[self._valores_inicio[entrada]:self._valores_inicio[entrada + 1]]]
+
+    def entrada(self, clave):
+        """Posición de la clave en el índice (búsqueda binaria), o None"""
+        if not isinstance(clave, str):
+            return None
+        bajo, alto = 0, self._entradas
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            actual = self._cadena(self._claves[self._orden[medio]])
+            if actual < clave:
+                bajo = medio + 1
+            elif actual > clave:
+                alto = medio
+            else:
+                return self._orden[medio]
+        return None
+
+    def resultado(self, rango):
+        """(clave, valor) del patrón con ese rango en el autómata"""
+        return self._cadena(self._claves[self._resultado_entrada[rango]]), self._cadena(self._resultado_valor[rango])
+
+    def compilada(self, clave):
+        return clave not in self._borradas and self.entrada(clave) is not None
+
+    def __contains__(self, clave):
+        return clave in self._cambios or self.compilada(clave)
+
+    def __getitem__(self, clave):
+        if clave in self._cambios:
+            return self._cambios[clave]
+        entrada = None if clave in self._borradas else self.entrada(clave)
+        if entrada is None:
+            raise KeyError(clave)
+        return self._valores_entrada(entrada)
+
+    def __setitem__(self, clave, valores):
+        if clave not in self._cambios and not self.compilada(clave) and clave not in self._borradas:
+            self._nuevas += 1
+        self._borradas.discard(clave)
+        self._cambios[clave] = valores
+
+    def __delitem__(self, clave):
+        if clave not in self:
+            raise KeyError(clave)
+        en_indice = self.entrada(clave) is not None
+        if self._cambios.pop(clave, None) is not None and not en_indice:
+            self._nuevas -= 1
+        if en_indice:
+            self._borradas.add(clave)
+        self.indice.quitar(clave)
+
+    def __iter__(self):
+        for i in range(self._entradas):
+            clave = self._cadena(self._claves[i])
+            if clave not in self._borradas:
+                yield clave
+        for clave in self._cambios:
+            if self.entrada(clave) is None:
+                yield clave
+
+    def __len__(self):
+        return self._entradas - len(self._borradas) + self._nuevas
+
+class IndiceCompilado:
+    """Búsqueda Aho-Corasick sobre el autómata del índice binario, sin construir nada al cargar"""
+
+    def __init__(self, base):
+        self.base = base
+        self._extra = None     # Autómata en memoria de las claves agregadas en esta ejecución
+        self._completo = None  # Autómata en memoria de toda la base si se modificó una clave existente
+        self._obsoleto = False # Se borró una clave: el autómata completo se rehace en la próxima búsqueda
+
+    def agregar(self, clave):
+        if self._obsoleto:
+            return  # Entra al rehacer el autómata
+        if self._completo is not None:
+            self._completo.agregar(clave)
+        elif self.base.entrada(clave) is not None:
+            # Cambian los valores de una clave del índice: sus rangos ya no sirven
+            self._completo = IndiceDeteccion(self.base)
+        elif self._extra is None:
+            self._extra = IndiceDeteccion({clave: self.base[clave]})
+        else:
+            self._extra.base[clave] = self.base[clave]
+            self._extra.agregar(clave)
+
+    def quitar(self, clave):
+        """Una clave borrada seguiría coincidiendo en los autómatas: se descartan todos"""
+        self._completo = self._extra = None
+        self._obsoleto = True
+
+    def buscar(self, nombre_lower):
+        """Devuelve (clave, valor) del patrón de mayor prioridad contenido en el nombre"""
+        if self._obsoleto:
+            self._completo, self._obsoleto = IndiceDeteccion(self.base), False
+        if self._completo is not None:
+            return self._completo.buscar(nombre_lower)
+        base = self.base
+        inicio, caracteres, destinos = base._hijos_inicio, base._hijos_caracter, base._hijos_destino
+        fallo, minimo = base._fallo, base._minimo
+        mejor = minimo[0]
+        nodo = 0
+        for caracter in nombre_lower:
+            codigo = ord(caracter)
+            while True:
+                desde, hasta = inicio[nodo], inicio[nodo + 1]
+                j = bisect.bisect_left(caracteres, codigo, desde, hasta)
+                if j < hasta and caracteres[j] == codigo:
+                    nodo = destinos[j]
+                    break
+                if not nodo:
+                    break
+                nodo = fallo[nodo]
+            rango = minimo[nodo]
+            if rango >= 0 and (mejor < 0 or rango < mejor):
+                mejor = rango
+        if mejor >= 0:
+            # Las claves agregadas después tienen siempre menos prioridad que las del índice
+            return base.resultado(mejor)
+        if self._extra is not None:
+            return self._extra.buscar(nombre_lower)
+        return None, None
+
+SEPARADORES = re.compile(r"[-_.\s]+")
+TOKEN_VERSION = re.compile(r"v?\d+[a-z]?\d*")
+# Tokens de arquitectura, versión o formato que no identifican al sistema
+PALABRAS_VACIAS = frozenset({
+    "x86", "x64", "x86_64", "amd64", "i386", "i486", "i586", "i686", "arm64", "aarch64", "armhf",
+    "32bit", "64bit", "bit", "live", "desktop", "iso", "img", "dvd", "dvd1", "cd", "netinst",
+    "installer", "install", "stable", "media", "minimal", "final", "release", "beta", "rc",
+    "lts", "full", "core", "standard", "english", "spanish", "multi",
+})
+
+UMBRAL_CONFIANZA = 0.65  # Puntuación mínima para elegir un icono sin preguntar
+MARGEN_CONFIANZA = 0.10  # Ventaja mínima sobre el segundo candidato
+
+def es_token_vacio(token):
+    return len(token) < 2 or token in PALABRAS_VACIAS or TOKEN_VERSION.fullmatch(token) is not None
+
+NO_ALFANUMERICO = re.compile(r"[^a-z0-9]")
+
+# Forma normalizada de un nombre, compartida por detección, puntuación de iconos y base de datos
+NombreNormalizado = namedtuple("NombreNormalizado", [
+    "minusculas",     # nombre en minúsculas
+    "partes",         # todos los tokens (para las claves exactas de la base)
+    "comprimido",     # solo letras y números (clave de las respuestas guardadas)
+    "significativos", # tokens sin versiones ni arquitecturas
+    "comparables",    # significativos y parejas seguidas ("zorin" + "os"), comprimidos
+])
+
+@functools.lru_cache(maxsize=4096)
+def normalizar_nombre(nombre):
+    """Divide y normaliza un nombre una sola vez por ejecución (caché acotada)"""
+    minusculas = nombre.lower()
+    partes = tuple(t for t in SEPARADORES.split(minusculas) if t)
+    significativos = tuple(t for t in partes if not es_token_vacio(t))
+    comparables = significativos + tuple(a + b for a, b in zip(significativos, significativos[1:]))
+    return NombreNormalizado(minusculas, partes, NO_ALFANUMERICO.sub("", minusculas), significativos,
+                             tuple(NO_ALFANUMERICO.sub("", c) for c in comparables))
+
+def misma_version(a, b):
+    """Tokens con las mismas cifras y letras que empiezan igual (como win11 y windows11)"""
+    cifras = DIGITOS.findall(a)
+    if not cifras or cifras != DIGITOS.findall(b):
+        return False
+    letras_a, letras_b = DIGITOS.sub("", a), DIGITOS.sub("", b)
+    return min(len(letras_a), len(letras_b)) >= 3 and (letras_a.startswith(letras_b)
+                                                       or letras_b.startswith(letras_a))
+
+def distancia_edicion(a, b):
+    """Distancia de Levenshtein (dos filas)"""
+    if len(a) < len(b):
+        a, b = b, a
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        anterior = actual
+    return anterior[-1]
+
+def elegir_automatico(puntuados):
+    """Icono a usar sin preguntar: único candidato o claramente mejor que el resto"""
+    if len(puntuados) == 1:
+        return puntuados[0][0]
+    if len(puntuados) > 1:
+        (mejor, puntuacion), (_, segunda) = puntuados[0], puntuados[1]
+        if puntuacion >= UMBRAL_CONFIANZA and puntuacion - segunda >= MARGEN_CONFIANZA:
+            return mejor
+    return None
+
+class IndiceIconos:
+    """Índice en memoria de los iconos .png de un tema"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.mtime = os.stat(ruta).st_mtime_ns
+        self.iconos = []       # Nombres sin extensión, en el orden del listado
+        self._exactos = {}     # nombre en minúsculas -> posiciones
+        self._subcadenas = {}  # subcadena del nombre en minúsculas -> posiciones
+        self.tokens = []       # Tokens significativos de cada icono (para puntuar)
+        self.comprimidos = []  # Nombre en minúsculas sin separadores
+        self._largo_maximo = 0
+        self._version = None
+        for archivo in os.listdir(ruta):
+            if archivo.endswith(".png"):
+                self._insertar(os.path.splitext(archivo)[0])
+
+    def _insertar(self, icono):
+        posicion = len(self.iconos)
+        self.iconos.append(icono)
+        self._version = None
+        nombre = normalizar_nombre(icono)
+        normalizado = nombre.minusculas
+        self.tokens.append(nombre.significativos or (normalizado,))
+        self.comprimidos.append(nombre.comprimido)
+        self._exactos.setdefault(normalizado, []).append(posicion)
+        self._largo_maximo = max(self._largo_maximo, len(normalizado))
+        largo = len(normalizado)
+        subcadenas = {normalizado[i:j] for i in range(largo) for j in range(i + 1, largo + 1)}
+        subcadenas.add("")
+        for subcadena in subcadenas:
+            self._subcadenas.setdefault(subcadena, []).append(posicion)
+
+    def __contains__(self, icono):
+        return icono.lower() in self._exactos
+
+    @property
+    def version(self):
+        """Huella del conjunto de iconos, estable entre ejecuciones"""
+        if self._version is None:
+            import hashlib
+            contenido = "\n".join(sorted(self.iconos)).encode("utf-8")
+            self._version = hashlib.sha1(contenido).hexdigest()[:16]
+        return self._version
+
+    def agregar(self, icono):
+        """Inserta un icono recién copiado sin volver a listar la carpeta"""
+        if icono not in self.iconos:
+            self._insertar(icono)
+        self.mtime = os.stat(self.ruta).st_mtime_ns
+
+    def contenidos_en(self, texto):
+        """Posiciones de los iconos cuyo nombre está contenido en el texto"""
+        posiciones = set()
+        largo = len(texto)
+        for i in range(largo + 1):
+            for j in range(i, min(largo, i + self._largo_maximo) + 1):
+                posiciones.update(self._exactos.get(texto[i:j], ()))
+        return posiciones
+
+    def exactos(self, texto):
+        """Posiciones de los iconos que se llaman exactamente como el texto"""
+        return self._exactos.get(texto, ())
+
+    def que_contienen(self, texto):
+        """Posiciones de los iconos cuyo nombre contiene el texto"""
+        return self._subcadenas.get(texto, ())
+
+# Clasificador de nombres: n-gramas de caracteres en un espacio de tamaño fijo (hashing)
+DIMENSION_CLASIFICADOR = 1 << 14
+NGRAMAS_CLASIFICADOR = (3, 4, 5)
+# Único criterio para aceptar su respuesta sin preguntar: fracción de n-gramas del nombre ya
+# vistos en el sistema elegido (la probabilidad a posteriori satura cerca de 1 y no sirve de filtro)
+COBERTURA_CLASIFICADOR = 0.60
+DIGITOS = re.compile(r"\d+")
+
+@functools.lru_cache(maxsize=4096)
+def ngramas_nombre(nombre):
+    """Posiciones (sin repetir) de los n-gramas del nombre; los números cuentan como '0'"""
+    texto = " " + " ".join(DIGITOS.sub("0", t) for t in normalizar_nombre(nombre).significativos) + " "
+    posiciones = set()
+    for n in NGRAMAS_CLASIFICADOR:
+        for i in range(len(texto) - n + 1):
+            posiciones.add(zlib.crc32(texto[i:i + n].encode()) % DIMENSION_CLASIFICADOR)
+    return tuple(posiciones)
+
+class ClasificadorNombres:
+    """Naive Bayes multinomial sobre n-gramas de caracteres, guardado por n-grama en arrays"""
+
+    def __init__(self, alfa=0.1):
+        self.alfa = alfa
+        self.sistemas = []
+        self._posicion = {}   # sistema -> índice
+        self._totales = []    # n-gramas vistos por sistema
+        self._ejemplos = []   # nombres de entrenamiento por sistema
+        # Por cada n-grama: sistemas que lo vieron (array 'I'), veces y peso log(1 + n / alfa) (array 'f');
+        # al puntuar solo se recorren estas celdas, no todos los sistemas
+        self._sistemas_de = [None] * DIMENSION_CLASIFICADOR
+        self._conteos_de = [None] * DIMENSION_CLASIFICADOR
+        self._pesos_de = [None] * DIMENSION_CLASIFICADOR
+
+    def __len__(self):
+        return sum(self._ejemplos)
+
+    def aprender(self, nombre, sistema):
+        """Entrenamiento incremental: actualiza solo las celdas de los n-gramas del nombre"""
+        posiciones = ngramas_nombre(nombre)
+        if not posiciones or not sistema or sistema == "unknown":
+            return
+        c = self._posicion.get(sistema)
+        if c is None:
+            c = self._posicion[sistema] = len(self.sistemas)
+            self.sistemas.append(sistema)
+            self._totales.append(0)
+            self._ejemplos.append(0)
+        for p in posiciones:
+            sistemas = self._sistemas_de[p]
+            if sistemas is None:
+                sistemas = self._sistemas_de[p] = array("I")
+                self._conteos_de[p], self._pesos_de[p] = array("f"), array("f")
+            # Celdas ordenadas por sistema: búsqueda binaria en vez de recorrer miles de sistemas
+            j = bisect.bisect_left(sistemas, c)
+            if j == len(sistemas) or sistemas[j] != c:
+                sistemas.insert(j, c)
+                self._conteos_de[p].insert(j, 0)
+                self._pesos_de[p].insert(j, 0)
+            self._conteos_de[p][j] += 1
+            self._pesos_de[p][j] = math.log1p(self._conteos_de[p][j] / self.alfa)
+        self._totales[c] += len(posiciones)
+        self._ejemplos[c] += 1
+
+    def clasificar(self, nombre):
+        """(sistema, cobertura) más probable, o (None, 0) sin datos
+
+        El sistema es el de mayor probabilidad a posteriori; la cobertura es la fracción de
+        n-gramas del nombre que ese sistema ya vio, y es lo que decide si se acepta.
+        """
+        posiciones = ngramas_nombre(nombre)
+        acumulado = {}
+        for p in posiciones:
+            sistemas = self._sistemas_de[p]
+            if sistemas is not None:
+                for c, peso in zip(sistemas, self._pesos_de[p]):
+                    acumulado[c] = acumulado.get(c, 0.0) + peso
+        if not acumulado:
+            return None, 0.0
+        k = len(posiciones)
+        log_total = math.log(len(self))
+        log_alfa = math.log(self.alfa)
+        ruido = self.alfa * DIMENSION_CLASIFICADOR
+        # log P(c) + k·log(alfa / (N_c + alfa·D)) + Σ log(1 + n_cf / alfa)
+        puntuaciones = {c: suma + math.log(self._ejemplos[c]) - log_total
+                        + k * (log_alfa - math.log(self._totales[c] + ruido))
+                        for c, suma in acumulado.items()}
+        mejor = max(puntuaciones, key=puntuaciones.__getitem__)
+        cobertura = sum(1 for p in posiciones
+                        if self._sistemas_de[p] is not None and mejor in self._sistemas_de[p]) / k
+        return self.sistemas[mejor], cobertura
+
+class EstadoEscaneo:
+    """Estado persistente de las ISOs ya resueltas, guardado junto a Ventoy.Json"""
+
+    VERSION = 1
+
+    def __init__(self, ruta="estado_escaneo.json"):
+        self.ruta = ruta
+        self.isos = {}
+        self.identidades = {}         # Huella -> última resolución de una ISO con ese contenido
+        self._stats = {}
+        self._cambiado = False
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            if datos.get("version") == self.VERSION:
+                self.isos = datos.get("isos", {})
+                self.identidades = datos.get("identidades", {})
+        except (OSError, ValueError):
+            pass
+
+    def _stat(self, archivo, ruta_iso):
+        if archivo not in self._stats:
+            try:
+                self._stats[archivo] = os.stat(ruta_iso)
+            except OSError:
+                self._stats[archivo] = None
+        return self._stats[archivo]
+
+    def precargar(self, archivo, info):
+        """Reutiliza el stat obtenido al recorrer el USB"""
+        self._stats[archivo] = info
+
+    def entrada(self, archivo, ruta_iso):
+        """Entrada de la ISO si el archivo no cambió desde que se resolvió"""
+        entrada = self.isos.get(archivo)
+        info = self._stat(archivo, ruta_iso)
+        if entrada is None or info is None:
+            return None
+        if entrada["tamano"] != info.st_size or entrada["mtime"] != info.st_mtime_ns:
+            return None
+        return entrada
+
+    def cambio(self, archivo, ruta_iso):
+        """Indica si una ISO ya registrada fue reemplazada por otro archivo"""
+        return archivo in self.isos and self.entrada(archivo, ruta_iso) is None
+
+    def clase(self, archivo, ruta_iso, tema, version):
+        """Clase resuelta para el tema si ni la ISO ni los iconos cambiaron"""
+        entrada = self.entrada(archivo, ruta_iso)
+        if entrada is None:
+            return None
+        resuelta = entrada["clases"].get(tema)
+        if resuelta is None or resuelta["version"] != version:
+            return None
+        return resuelta["clase"]
+
+    def _entrada_vigente(self, archivo, ruta_iso):
+        """Entrada de la ISO, creándola de nuevo si el archivo cambió"""
+        entrada = self.entrada(archivo, ruta_iso)
+        if entrada is None:
+            info = self._stat(archivo, ruta_iso)
+            if info is None:
+                return None
+            entrada = {"tamano": info.st_size, "mtime": info.st_mtime_ns, "clases": {}}
+            self.isos[archivo] = entrada
+        return entrada
+
+    def etiquetas(self, archivo, ruta_iso):
+        """Etiquetas de volumen de la ISO, leídas solo si cambió el archivo"""
+        entrada = self.entrada(archivo, ruta_iso)
+        if entrada is not None and "etiquetas" in entrada:
+            return entrada["etiquetas"]
+        etiquetas = leer_etiquetas_iso(ruta_iso)
+        entrada = self._entrada_vigente(archivo, ruta_iso)
+        if entrada is not None:
+            entrada["etiquetas"] = etiquetas
+            self._cambiado = True
+        return etiquetas
+
+    def huella(self, archivo, ruta_iso):
+        """Huella de contenido de la ISO, calculada solo si cambió el archivo"""
+        entrada = self._entrada_vigente(archivo, ruta_iso)
+        if entrada is None:
+            return None
+        if "huella" not in entrada:
+            try:
+                entrada["huella"] = huella_iso(ruta_iso)
+            except (OSError, ValueError):
+                return None
+            self._cambiado = True
+        return entrada["huella"]
+
+    def identidad(self, archivo, ruta_iso):
+        """Resolución guardada de una imagen con el mismo contenido (aunque tuviera otro nombre)"""
+        huella = self.huella(archivo, ruta_iso)
+        return self.identidades.get(huella) if huella else None
+
+    def registrar(self, archivo, ruta_iso, clave, sistema, tema=None, version=None, clase=None):
+        """Guarda la detección (y la clase para el tema) de una ISO"""
+        entrada = self._entrada_vigente(archivo, ruta_iso)
+        if entrada is None:
+            return
+        entrada["clave"] = clave
+        entrada["sistema"] = sistema
+        if tema is not None:
+            entrada["clases"][tema] = {"version": version, "clase": clase}
+        self._cambiado = True
+
+    def podar(self, archivos):
+        """Descarta las ISOs que ya no están en el USB y rehace el índice de identidades"""
+        for archivo in set(self.isos) - set(archivos):
+            del self.isos[archivo]
+            self._cambiado = True
+        # Las ISOs que siguen en el USB aportan su resolución para cuando se renombren o muevan
+        identidades = {entrada["huella"]: {"archivo": archivo, "clave": entrada.get("clave"),
+                                           "sistema": entrada.get("sistema"), "clases": entrada["clases"]}
+                       for archivo, entrada in self.isos.items()
+                       if "huella" in entrada and (entrada.get("clave") or entrada["clases"])}
+        if identidades != self.identidades:
+            self.identidades = identidades
+            self._cambiado = True
+
+    def guardar(self):
+        """Escribe el estado si hubo cambios"""
+        if not self._cambiado:
+            return
+        escribir_json_atomico(self.ruta, {"version": self.VERSION, "isos": self.isos,
+                                          "identidades": self.identidades}, indent=1)
+        self._cambiado = False
+
+def copiar_carpeta(origen, destino):
+    """Copia una carpeta omitiendo los archivos que ya son iguales (tamaño y fecha); devuelve los copiados"""
+    import shutil
+    copiados = 0
+    for carpeta, _, archivos in os.walk(origen):
+        relativa = os.path.relpath(carpeta, origen)
+        carpeta_destino = os.path.normpath(os.path.join(destino, relativa))
+        os.makedirs(carpeta_destino, exist_ok=True)
+        for archivo in archivos:
+            fuente, copia = os.path.join(carpeta, archivo), os.path.join(carpeta_destino, archivo)
+            info = os.stat(fuente)
+            try:
+                actual = os.stat(copia)
+                # FAT guarda la fecha con 2 s de resolución
+                if actual.st_size == info.st_size and abs(actual.st_mtime - info.st_mtime) <= 2:
+                    continue
+            except FileNotFoundError:
+                pass
+            shutil.copy2(fuente, copia)
+            copiados += 1
+    return copiados
+
+PROPIEDAD_TEMA = re.compile(r'^\s*([A-Za-z][\w-]*)\s*[:=]\s*"([^"]*)"', re.MULTILINE)
+MEDIDA_TEMA = re.compile(r'^\s*(icon_width|icon_height)\s*=\s*"?(\d+)', re.MULTILINE)
+EXTENSIONES_IMAGEN_TEMA = (".png", ".jpg", ".jpeg", ".tga")
+
+def medidas_png(ruta):
+    """(ancho, alto) leídos de la cabecera IHDR de un PNG, o None"""
+    try:
+        with open(ruta, "rb") as f:
+            cabecera = f.read(24)
+    except OSError:
+        return None
+    if len(cabecera) < 24 or cabecera[:8] != b"\x89PNG\r\n\x1a\n" or cabecera[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", cabecera[16:24])
+
+FIRMA_PNG = b"\x89PNG\r\n\x1a\n"
+TAMANO_ICONO_GRUB = 32  # GRUB dibuja los iconos a 32x32 si theme.txt no fija icon_width/icon_height
+CANALES_PNG = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+CHUNKS_NECESARIOS = (b"IHDR", b"PLTE", b"tRNS", b"IDAT", b"IEND")  # El resto son metadatos
+
+def leer_chunks_png(datos):
+    """Lista de (tipo, contenido) de un PNG; ValueError si no lo es"""
+    if not datos.startswith(FIRMA_PNG):
+        raise ValueError("no es un PNG")
+    chunks, posicion = [], len(FIRMA_PNG)
+    while posicion + 8 <= len(datos):
+        largo, tipo = struct.unpack(">I4s", datos[posicion:posicion + 8])
+        chunks.append((tipo, datos[posicion + 8:posicion + 8 + largo]))
+        posicion += 12 + largo
+        if tipo == b"IEND":
+            return chunks
+    raise ValueError("PNG truncado")
+
+def _chunk_png(tipo, contenido):
+    return struct.pack(">I", len(contenido)) + tipo + contenido + struct.pack(">I", zlib.crc32(tipo + contenido))
+
+def _quitar_filtros(datos, largo_fila, alto, bpp):
+    """Deshace los filtros PNG (None, Sub, Up, Average, Paeth) fila a fila"""
+    salida = bytearray()
+    previa = bytearray(largo_fila)
+    posicion = 0
+    for _ in range(alto):
+        filtro = datos[posicion]
+        fila = bytearray(datos[posicion + 1:posicion + 1 + largo_fila])
+        posicion += 1 + largo_fila
+        if filtro == 1:
+            for i in range(bpp, largo_fila):
+                fila[i] = (fila[i] + fila[i - bpp]) & 255
+        elif filtro == 2:
+            fila = bytearray((a + b) & 255 for a, b in zip(fila, previa))
+        elif filtro == 3:
+            for i in range(largo_fila):
+                izquierda = fila[i - bpp] if i >= bpp else 0
+                fila[i] = (fila[i] + ((izquierda + previa[i]) >> 1)) & 255
+        elif filtro == 4:
+            for i in range(largo_fila):
+                a = fila[i - bpp] if i >= bpp else 0
+                b = previa[i]
+                c = previa[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                fila[i] = (fila[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 255
+        elif filtro != 0:
+            raise ValueError(f"filtro PNG desconocido: {filtro}")
+        salida += fila
+        previa = fila
+    return salida
+
+def _muestras(fila, profundidad, cantidad):
+    """Valores de las muestras de una fila con 1, 2, 4, 8 o 16 bits cada una"""
+    if profundidad == 8:
+        return fila[:cantidad]
+    if profundidad == 16:
+        return [(fila[i] << 8) | fila[i + 1] for i in range(0, 2 * cantidad, 2)]
+    mascara = (1 << profundidad) - 1
+    return [(byte >> desplazamiento) & mascara for byte in fila
+            for desplazamiento in range(8 - profundidad, -1, -profundidad)][:cantidad]
+
+def decodificar_png(chunks):
+    """(ancho, alto, píxeles RGBA de 8 bits) o None si es entrelazado o no se reconoce"""
+    ancho, alto, profundidad, tipo, _, _, entrelazado = struct.unpack(">IIBBBBB", chunks[0][1])
+    if entrelazado or tipo not in CANALES_PNG:
+        return None
+    canales = CANALES_PNG[tipo]
+    largo_fila = (ancho * canales * profundidad + 7) // 8
+    datos = zlib.decompress(b"".join(c for t, c in chunks if t == b"IDAT"))
+    crudo = _quitar_filtros(datos, largo_fila, alto, max(1, canales * profundidad // 8))
+    paleta = next((c for t, c in chunks if t == b"PLTE"), b"")
+    transparencia = next((c for t, c in chunks if t == b"tRNS"), None)
+    maximo = (1 << profundidad) - 1
+    escala = (lambda v: v >> 8) if profundidad == 16 else (lambda v: v * 255 // maximo)
+    clave = None
+    if transparencia is not None and tipo in (0, 2):
+        clave = struct.unpack(f">{canales}H", transparencia[:2 * canales])
+    alfas = transparencia or b""
+
+    rgba = bytearray()
+    for y in range(alto):
+        muestras = _muestras(crudo[y * largo_fila:(y + 1) * largo_fila], profundidad, ancho * canales)
+        for x in range(0, ancho * canales, canales):
+            pixel = muestras[x:x + canales]
+            if tipo == 3:
+                i = pixel[0]
+                rgba += paleta[3 * i:3 * i + 3] + bytes((alfas[i] if i < len(alfas) else 255,))
+            elif tipo == 0:
+                g = escala(pixel[0])
+                rgba += bytes((g, g, g, 0 if clave and pixel[0] == clave[0] else 255))
+            elif tipo == 2:
+                rgba += bytes((escala(pixel[0]), escala(pixel[1]), escala(pixel[2]),
+                               0 if clave and tuple(pixel) == clave else 255))
+            elif tipo == 4:
+                g = escala(pixel[0])
+                rgba += bytes((g, g, g, escala(pixel[1])))
+            else:
+                rgba += bytes(escala(v) for v in pixel)
+    return ancho, alto, rgba
+
+def reducir_rgba(ancho, alto, rgba, nuevo_ancho, nuevo_alto):
+    """Reduce la imagen promediando cada área (color ponderado por su alfa, sin halos oscuros)"""
+    def tramos(origen, destino):
+        return [(i * origen // destino, max(i * origen // destino + 1, (i + 1) * origen // destino))
+                for i in range(destino)]
+    columnas = tramos(ancho, nuevo_ancho)
+    salida = bytearray()
+    for y0, y1 in tramos(alto, nuevo_alto):
+        for x0, x1 in columnas:
+            r = g = b = a = 0
+            for y in range(y0, y1):
+                for i in range(4 * (y * ancho + x0), 4 * (y * ancho + x1), 4):
+                    alfa = rgba[i + 3]
+                    r += rgba[i] * alfa
+                    g += rgba[i + 1] * alfa
+                    b += rgba[i + 2] * alfa
+                    a += alfa
+            n = (y1 - y0) * (x1 - x0)
+            if a:
+                salida += bytes((round(r / a), round(g / a), round(b / a), round(a / n)))
+            else:
+                salida += bytes(4)
+    return salida
+
+def _filtrar_fila(fila, previa, bpp):
+    """Elige el filtro PNG con menor suma de diferencias absolutas (heurística de libpng)"""
+    izquierda = bytes(bpp) + fila[:-bpp]
+    arriba_izquierda = bytes(bpp) + previa[:-bpp]
+    candidatas = [
+        fila,
+        bytes((v - a) & 255 for v, a in zip(fila, izquierda)),
+        bytes((v - b) & 255 for v, b in zip(fila, previa)),
+        bytes((v - ((a + b) >> 1)) & 255 for v, a, b in zip(fila, izquierda, previa)),
+    ]
+    paeth = bytearray()
+    for v, a, b, c in zip(fila, izquierda, previa, arriba_izquierda):
+        p = a + b - c
+        pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+        paeth.append((v - (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 255)
+    candidatas.append(bytes(paeth))
+    costes = [sum(v if v < 128 else 256 - v for v in candidata) for candidata in candidatas]
+    filtro = costes.index(min(costes))
+    return bytes((filtro,)) + candidatas[filtro]
+
+def codificar_png(ancho, alto, rgba):
+    """PNG de 8 bits sin metadatos: RGB si todos los píxeles son opacos, RGBA si no"""
+    opaco = all(a == 255 for a in rgba[3::4])
+    if opaco:
+        pixeles = bytearray(len(rgba) // 4 * 3)
+        for c in range(3):
+            pixeles[c::3] = rgba[c::4]
+        tipo, bpp = 2, 3
+    else:
+        pixeles, tipo, bpp = rgba, 6, 4
+    largo_fila = ancho * bpp
+    crudo = bytearray()
+    previa = bytes(largo_fila)
+    for y in range(alto):
+        fila = bytes(pixeles[y * largo_fila:(y + 1) * largo_fila])
+        crudo += _filtrar_fila(fila, previa, bpp)
+        previa = fila
+    return (FIRMA_PNG + _chunk_png(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, tipo, 0, 0, 0))
+            + _chunk_png(b"IDAT", zlib.compress(bytes(crudo), 9)) + _chunk_png(b"IEND", b""))
+
+def optimizar_png(ruta, ancho, alto):
+    """Versión optimizada de un icono (se ejecuta en otro proceso): reescalado, sin metadatos y recomprimido"""
+    import hashlib
+    resultado = {"original": 0, "nuevo": 0, "datos": None, "huella": None, "acciones": [], "error": None}
+    try:
+        with open(ruta, "rb") as f:
+            datos = f.read()
+        resultado["original"] = resultado["nuevo"] = len(datos)
+        chunks = leer_chunks_png(datos)
+        limpio = FIRMA_PNG + b"".join(_chunk_png(t, c) for t, c in chunks if t in CHUNKS_NECESARIOS)
+        decodificado = decodificar_png(chunks)
+    except (OSError, ValueError, struct.error, zlib.error) as e:
+        resultado["error"] = str(e)
+        return resultado
+
+    mejor, acciones = datos, []
+    if len(limpio) < len(datos):
+        mejor, acciones = limpio, ["sin metadatos"]
+    if decodificado is None:
+        resultado["huella"] = hashlib.blake2b(datos, digest_size=16).hexdigest()
+    else:
+        w, h, rgba = decodificado
+        # Dos iconos son duplicados si tienen los mismos píxeles, aunque el archivo difiera
+        resultado["huella"] = hashlib.blake2b(struct.pack(">II", w, h) + rgba, digest_size=16).hexdigest()
+        reescalado = w > ancho or h > alto
+        if reescalado:
+            rgba = reducir_rgba(w, h, rgba, ancho, alto)
+        recodificado = codificar_png(ancho if reescalado else w, alto if reescalado else h, rgba)
+        if reescalado or len(recodificado) < len(mejor):
+            mejor, acciones = recodificado, ["recomprimido"]
+            if reescalado:
+                acciones.insert(0, f"{w}x{h} -> {ancho}x{alto}")
+            if recodificado[25] == 2 and chunks[0][1][9] in (4, 6):
+                acciones.append("sin canal alfa")
+    if mejor is not datos:
+        resultado.update(datos=mejor, nuevo=len(mejor), acciones=acciones)
+    return resultado
+
+def leer_nombre_pf2(ruta):
+    """Nombre de una fuente GRUB (.pf2) según su sección NAME, o None"""
+    try:
+        with open(ruta, "rb") as f:
+            datos = f.read(512)
+    except OSError:
+        return None
+    posicion = 0
+    while posicion + 8 <= len(datos):
+        seccion, largo = datos[posicion:posicion + 4], struct.unpack(">I", datos[posicion + 4:posicion + 8])[0]
+        posicion += 8
+        if seccion == b"NAME":
+            return datos[posicion:posicion + largo].rstrip(b"\x00").decode("ascii", "replace")
+        if seccion not in (b"FILE",):
+            return None
+        posicion += largo
+    return None
+
+def analizar_tema(ruta_tema):
+    """Analiza theme.txt una vez: imágenes, fuentes, iconos y resolución del tema"""
+    info = {"problemas": [], "imagenes": [], "fuentes": [], "fuentes_tema": [], "fondo": None,
+            "iconos": 0, "resolucion": None, "icono_ancho": None, "icono_alto": None}
+    try:
+        with open(os.path.join(ruta_tema, "theme.txt"), "r", encoding="utf-8", errors="replace") as f:
+            texto = f.read()
+    except OSError as e:
+        info["problemas"].append(f"No se pudo leer theme.txt: {e}")
+        return info
+
+    for propiedad, valor in PROPIEDAD_TEMA.findall(texto):
+        if propiedad.lower().endswith("font"):
+            if valor not in info["fuentes"]:
+                info["fuentes"].append(valor)
+        elif valor.lower().endswith(EXTENSIONES_IMAGEN_TEMA):
+            info["imagenes"].append(valor)
+            # Los estilos de pixmap ("menu_*.png") usan varias piezas: basta con que exista alguna
+            patron = os.path.join(ruta_tema, glob.escape(valor).replace(glob.escape("*"), "*"))
+            if not glob.glob(patron):
+                info["problemas"].append(f"Falta la imagen '{valor}' ({propiedad})")
+            if propiedad == "desktop-image":
+                info["fondo"] = valor
+                medidas = medidas_png(os.path.join(ruta_tema, valor))
+                if medidas:
+                    info["resolucion"] = f"{medidas[0]}x{medidas[1]}"
+    for propiedad, valor in MEDIDA_TEMA.findall(texto):
+        info["icono_ancho" if propiedad == "icon_width" else "icono_alto"] = int(valor)
+
+    try:
+        with os.scandir(ruta_tema) as entradas:
+            for entrada in entradas:
+                if entrada.name.lower().endswith(".pf2"):
+                    nombre = leer_nombre_pf2(entrada.path)
+                    if nombre:
+                        info["fuentes_tema"].append(nombre)
+    except OSError:
+        pass
+    try:
+        with os.scandir(os.path.join(ruta_tema, "icons")) as entradas:
+            info["iconos"] = sum(1 for e in entradas if e.name.endswith(".png"))
+    except OSError:
+        info["problemas"].append("No tiene carpeta icons")
+    return info
+
+class CatalogoTemas:
+    """Metadatos de los temas de Themes/, guardados junto a Ventoy.Json y reanalizados solo si cambian"""
+
+    VERSION = 2
+
+    def __init__(self, ruta="catalogo_temas.json", carpeta="Themes"):
+        self.ruta = ruta
+        self.carpeta = carpeta
+        self.temas = {}
+        self._vigente = False
+        self._cambiado = False
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            if datos.get("version") == self.VERSION:
+                self.temas = datos.get("temas", {})
+        except (OSError, ValueError):
+            pass
+
+    def _firma(self, ruta_tema):
+        """mtime de la carpeta, de theme.txt y de icons: si no cambian, el análisis sigue valiendo"""
+        firma = []
+        for ruta in (ruta_tema, os.path.join(ruta_tema, "theme.txt"), os.path.join(ruta_tema, "icons")):
+            try:
+                firma.append(os.stat(ruta).st_mtime_ns)
+            except OSError:
+                firma.append(None)
+        return firma
+
+    def actualizar(self):
+        """Reanaliza solo los temas nuevos o modificados (una vez por ejecución)"""
+        if self._vigente:
+            return self.temas
+        nombres = []
+        try:
+            with os.scandir(self.carpeta) as entradas:
+                nombres = [e.name for e in entradas if e.is_dir()]
+        except OSError:
+            pass
+        for nombre in nombres:
+            ruta_tema = os.path.join(self.carpeta, nombre)
+            firma = self._firma(ruta_tema)
+            if firma[1] is None:
+                # Sin theme.txt no es un tema
+                if self.temas.pop(nombre, None) is not None:
+                    self._cambiado = True
+                continue
+            guardado = self.temas.get(nombre)
+            if guardado is None or guardado["firma"] != firma:
+                self.temas[nombre] = dict(analizar_tema(ruta_tema), firma=firma)
+                self._cambiado = True
+        for nombre in set(self.temas) - set(nombres):
+            del self.temas[nombre]
+            self._cambiado = True
+        self._vigente = True
+        return self.temas
+
+    def invalidar(self):
+        """Vuelve a comprobar las firmas en la próxima consulta"""
+        self._vigente = False
+
+    def guardar(self):
+        """Escribe el catálogo si hubo cambios"""
+        if not self._cambiado:
+            return
+        escribir_json_atomico(self.ruta, {"version": self.VERSION, "temas": self.temas}, indent=1)
+        self._cambiado = False
+
+class MenuClass:
+    """Entradas de menu_class indexadas por clave (key -> class)"""
+
+    def __init__(self, entradas=()):
+        self.clases = {}
+        self.otras = []  # Entradas sin "key" (por ejemplo "dir" o "parent"), se conservan tal cual
+        for entrada in entradas:
+            if "key" in entrada:
+                self.clases[entrada["key"]] = entrada["class"]
+            else:
+                self.otras.append(entrada)
+
+    def __contains__(self, clave):
+        return clave in self.clases
+
+    def __len__(self):
+        return len(self.clases)
+
+    def __getitem__(self, clave):
+        return self.clases[clave]
+
+    def __setitem__(self, clave, clase):
+        self.clases[clave] = clase
+
+    def get(self, clave, defecto=None):
+        return self.clases.get(clave, defecto)
+
+    def quitar(self, clave):
+        self.clases.pop(clave, None)
+
+    def conservar(self, claves):
+        """Elimina las entradas cuya clave no está en el conjunto dado"""
+        claves = set(claves)
+        self.clases = {k: v for k, v in self.clases.items() if k in claves}
+
+    def como_lista(self):
+        """Lista ordenada en el formato de Ventoy.Json"""
+        return [{"key": k, "class": v} for k, v in sorted(self.clases.items())] + self.otras
+
+    def expandir(self, archivos, registradas=None):
+        """Vuelve a una entrada por imagen si las claves son fragmentos de nombre (ver --compactar).
+
+        Solo las imágenes de registradas (todas si es None) toman la clase de un fragmento; las demás
+        quedan sin entrada para resolverse como nuevas."""
+        nombres = {clave_iso(a): a for a in archivos}
+        sobrantes = [k for k in self.clases if k not in nombres]
+        if not sobrantes:
+            return False
+        # Las reglas de --compactar son prefijos de nombres actuales: búsqueda binaria, no un recorrido
+        ordenados = sorted(nombres)
+        fragmentos = []
+        for clave in sobrantes:
+            i = bisect.bisect_left(ordenados, clave)
+            if i < len(ordenados) and ordenados[i].startswith(clave):
+                fragmentos.append(clave)
+        if not fragmentos:
+            return False
+        # Autómata sobre las claves en el orden de la lista: la de menor rango es la que elige Ventoy
+        reglas = IndiceDeteccion({clave: [] for clave in self.clases})
+        for clave, archivo in nombres.items():
+            if clave not in self.clases and (registradas is None or archivo in registradas):
+                regla, _ = reglas.buscar(archivo.rsplit("/", 1)[-1])
+                if regla is not None:
+                    self.clases[clave] = self.clases[regla]
+        for clave in fragmentos:
+            del self.clases[clave]
+        return True
+
+# Compactación de menu_class: Ventoy da a cada imagen la clase de la primera "key" contenida en su
+# nombre de archivo (y más corta que él), así que una regla "linuxmint" sirve para todas sus versiones
+LONGITUD_MINIMA_FRAGMENTO = 4
+SEPARADORES_FRAGMENTO = "-_. +"
+
+def clase_en_arranque(nombre, reglas):
+    """Clase que Ventoy asigna a un archivo y cuántas claves compara hasta encontrarla"""
+    for comparadas, (clave, clase) in enumerate(reglas, 1):
+        if len(clave) < len(nombre) and clave in nombre:
+            return clase, comparadas
+    return None, len(reglas)
+
+def fragmentos_nombre(clave):
+    """Prefijos de la clave cortados antes de un separador o de un cambio entre letras y cifras"""
+    fragmentos = []
+    for i in range(LONGITUD_MINIMA_FRAGMENTO, len(clave)):
+        anterior, siguiente = clave[i - 1], clave[i]
+        if anterior in SEPARADORES_FRAGMENTO:
+            continue
+        if siguiente in SEPARADORES_FRAGMENTO or anterior.isdigit() != siguiente.isdigit():
+            fragmentos.append(clave[:i])
+    return fragmentos
+
+def verificar_reglas(reglas, objetivo):
+    """Archivos a los que las reglas no dan la clase esperada (vacío si la compactación es correcta)"""
+    return sorted(n for n, clase in objetivo.items() if clase_en_arranque(n, reglas)[0] != clase)
+
+def compactar_menu_class(clases, archivos):
+    """Reglas (key, class) mínimas que dan a cada imagen la clase de su entrada propia.
+
+    Devuelve (reglas, objetivo); reglas es None si no se logra sin cambiar la clase de alguna imagen."""
+    objetivo = {}
+    for archivo in archivos:
+        clase = clases.get(clave_iso(archivo))
+        if clase is not None:
+            objetivo[archivo.rsplit("/", 1)[-1]] = clase
+
+    # Fragmentos compartidos por varias imágenes de una clase; las de otra clase que también lo
+    # contienen son conflictos que una regla más larga (anterior en la lista) debe resolver antes
+    prefijados = {}
+    for nombre, clase in objetivo.items():
+        for fragmento in fragmentos_nombre(clave_iso(nombre)):
+            prefijados.setdefault((fragmento, clase), set()).add(nombre)
+    candidatos = {}
+    for (fragmento, clase), nombres in prefijados.items():
+        if len(nombres) < 2:
+            continue
+        contienen = {n for n in objetivo if len(fragmento) < len(n) and fragmento in n}
+        candidatos[fragmento, clase] = ({n for n in contienen if objetivo[n] == clase},
+                                        {n for n in contienen if objetivo[n] != clase})
+
+    # Cobertura voraz: el fragmento que más imágenes sin cubrir abarca; a igualdad, el más corto
+    # (linuxmint antes que linuxmint-21: sirve también para las versiones que se agreguen)
+    sin_cubrir = set(objetivo)
+    resueltas = {}  # Imagen -> longitud de la regla más larga (la primera en la lista) que la resuelve
+    reglas = {}
+    while candidatos:
+        cuenta, _, candidato = max(((len(cubre & sin_cubrir), -len(c[0]), c)
+                                    for c, (cubre, conflictos) in candidatos.items()
+                                    if all(resueltas.get(n, 0) > len(c[0]) for n in conflictos)),
+                                   default=(0, 0, None))
+        if cuenta < 2:
+            break
+        cubre, _ = candidatos.pop(candidato)
+        fragmento, reglas[fragmento] = candidato
+        sin_cubrir -= cubre
+        for nombre in cubre:
+            resueltas[nombre] = max(resueltas.get(nombre, 0), len(fragmento))
+    for nombre in sin_cubrir:
+        reglas[clave_iso(nombre)] = objetivo[nombre]
+    reglas = sorted(reglas.items(), key=lambda r: (-len(r[0]), r[0]))
+
+    # Las imágenes que otra clave más larga tapa pasan su entrada propia al principio
+    delante = []
+    while True:
+        fallidas = verificar_reglas(delante + reglas, objetivo)
+        if not fallidas:
+            return delante + reglas, objetivo
+        propias = {(clave_iso(n), objetivo[n]) for n in fallidas} - set(delante)
+        if not propias:
+            return None, objetivo
+        reglas = [r for r in reglas if r not in propias]
+        delante = sorted(set(delante) | propias, key=lambda r: (-len(r[0]), r[0]))
+
+def diferencia_config(actual, propuesta):
+    """Cambios entre dos Ventoy.Json: entradas de menu_class, tema y el resto de opciones"""
+    antes, despues = MenuClass(actual.get("menu_class", [])), MenuClass(propuesta.get("menu_class", []))
+    plan = {
+        "agregadas": {k: v for k, v in sorted(despues.clases.items()) if k not in antes},
+        "cambiadas": {k: {"antes": antes[k], "despues": v} for k, v in sorted(despues.clases.items())
+                      if k in antes and antes[k] != v},
+        "eliminadas": {k: v for k, v in sorted(antes.clases.items()) if k not in despues},
+        "tema": None,
+        "otras": {},
+    }
+    if actual.get("theme") != propuesta.get("theme"):
+        plan["tema"] = {"antes": actual.get("theme"), "despues": propuesta.get("theme")}
+    if antes.otras != despues.otras:
+        plan["otras"]["menu_class"] = {"antes": antes.otras, "despues": despues.otras}
+    for clave in sorted((set(actual) | set(propuesta)) - {"menu_class", "theme"}):
+        if actual.get(clave) != propuesta.get(clave):
+            plan["otras"][clave] = {"antes": actual.get(clave), "despues": propuesta.get(clave)}
+    return plan
+
+def plan_vacio(plan):
+    return not (plan["agregadas"] or plan["cambiadas"] or plan["eliminadas"] or plan["tema"] or plan["otras"])
+
+def describir_plan(plan):
+    """Texto del plan, una línea por cambio"""
+    if plan_vacio(plan):
+        return "sin cambios"
+    lineas = [f"+{len(plan['agregadas'])} ~{len(plan['cambiadas'])} -{len(plan['eliminadas'])}"]
+    if plan["tema"]:
+        antes, despues = (plan["tema"][k] and plan["tema"][k].get("file") for k in ("antes", "despues"))
+        lineas.append(f"  tema: {antes} -> {despues}")
+    lineas += [f"  + {k} -> {v}" for k, v in plan["agregadas"].items()]
+    lineas += [f"  ~ {k}: {v['antes']} -> {v['despues']}" for k, v in plan["cambiadas"].items()]
+    lineas += [f"  - {k} ({v})" for k, v in plan["eliminadas"].items()]
+    lineas += [f"  * {k} modificado" for k in plan["otras"]]
+    return "\n".join(lineas)
+
+class ResolucionIso:
+    """Resultado de resolver una ISO en la fase automática (sin preguntar al usuario)"""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.nombre = clave_iso(archivo)
+        self.clave = None
+        self.sistema = None
+        self.candidatos = []
+        self.clase = None         # Icono asignado; None mientras esté pendiente de revisión
+        self.reutilizada = False  # Tomada del estado de escaneo sin volver a resolver
+        self.clasificada = None   # Cobertura del clasificador si el sistema salió de él
+        self.heredada = None      # ISO con el mismo contenido de la que se tomó la resolución
+
+    @property
+    def pendiente(self):
+        return self.clase is None
+
+class ErrorResolucion(Exception):
+    """Una ISO no pudo resolverse con la política del modo sin interfaz"""
+
+class VentoyConfig:
+    """Lógica de configuración sin interfaz gráfica (modo --batch)"""
+
+    SISTEMAS_COMUNES = [
+        "ubuntu", "debian", "fedora", "archlinux", "windows", 
+        "linuxmint", "manjaro", "opensuse", "centos", "unknown"
+    ]
+
+    def __init__(self, si_ambiguo="primero", si_falta="unknown", detectar_contenido=False, hilos=None,
+                 extensiones=EXTENSIONES_IMAGEN, excluir=EXCLUIR_POR_DEFECTO, identidad_contenido=False):
+        self.si_ambiguo = si_ambiguo  # primero | unknown | fallar
+        self.si_falta = si_falta      # unknown | fallar
+        self.detectar_contenido = detectar_contenido  # Leer etiquetas de volumen de las ISOs
+        self.identidad_contenido = identidad_contenido  # Reconocer ISOs renombradas por su huella
+        self.simular = False          # Calcular los cambios sin escribir nada
+        self.solo_lectura = False     # --estado / --validar: no escribir ni cachés
+        self.compactar = False        # Escribir menu_class como reglas mínimas por fragmento de nombre
+        self.usar_clasificador = True # Probar el clasificador de nombres antes de preguntar
+        self.planes = []              # Cambios calculados para cada Ventoy.Json (ver --plan)
+        self.hilos = hilos            # Hilos para resolver ISOs (None: según los núcleos)
+        self.extensiones = extensiones
+        self.excluir = excluir
+        self.raiz_usb = None          # Raíz del USB (None: la carpeta padre de la actual)
+        self.raices_isos = {}         # Imagen -> USB que la contiene, si no es la raíz (--provisionar)
+        self._isos = None
+        self._directorios_isos = []
+        self._indice_deteccion = None
+        self._clasificador = None
+        self._bloqueo_clasificador = threading.Lock()
+        self._indices_iconos = {}
+        self._estado = None
+        self._catalogo = None
+        self._menu_class = None
+        self._base_modificada = False  # Respuestas nuevas pendientes de escribir en base_datos.json
 
-class VentoyConfigGUI:
-    def __init__(self):
-        self.root = tk.Tk()
-        self.root.withdraw()  # Ocultar ventana principal
-        
     def cargar_base_datos(self):
         """Cargar base de datos desde archivo externo"""
         try:
-            with open("base_datos.json", "r", encoding="utf-8") as f:
-                return json.load(f)
+            base = cargar_base_compilada(escribir=not (self.simular or self.solo_lectura))
         except FileNotFoundError:
-            return {}
+            base = {}
+        # El índice binario ya trae el autómata; un dict se compila una sola vez al cargar
+        self._indice_deteccion = base.indice if isinstance(base, BaseCompilada) else IndiceDeteccion(base)
+        return base
+
+    def obtener_indice_deteccion(self, base):
+        """Devuelve el índice de detección de la base, construyéndolo si hace falta"""
+        if self._indice_deteccion is None or self._indice_deteccion.base is not base:
+            self._indice_deteccion = base.indice if isinstance(base, BaseCompilada) else IndiceDeteccion(base)
+        return self._indice_deteccion
+
+    def obtener_clasificador(self, base):
+        """Clasificador entrenado con la base, las ISOs ya resueltas y el menu_class actual
+
+        Se entrena la primera vez que un nombre no se reconoce (desde los hilos de resolver_isos).
+        """
+        with self._bloqueo_clasificador:
+            if self._clasificador is None or self._clasificador[0] is not base:
+                clasificador = ClasificadorNombres()
+                claves = self._claves_por_sistema(base)
+                for clave, sistemas in base.items():
+                    clasificador.aprender(clave, sistemas[0])
+                for archivo, entrada in self.obtener_estado().isos.items():
+                    if entrada.get("sistema") in claves:
+                        clasificador.aprender(clave_iso(archivo), entrada["sistema"])
+                if self._menu_class is not None:
+                    # Solo las clases que son un sistema conocido (no iconos propios de una ISO)
+                    for nombre, clase in self._menu_class[1].clases.items():
+                        if clase.lower() in claves:
+                            clasificador.aprender(nombre, clase.lower())
+                self._clasificador = (base, clasificador, claves)
+            return self._clasificador[1]
+
+    @staticmethod
+    def _claves_por_sistema(base):
+        """Sistema -> clave de la base que lo tiene como equivalencia (la propia, si existe)"""
+        claves = {}
+        for clave, sistemas in base.items():
+            for sistema in sistemas:
+                if clave == sistema or sistema not in claves:
+                    claves[sistema] = clave
+        return claves
+
+    def clasificar_nombre(self, nombre_iso, base):
+        """(clave, sistema, cobertura) según el clasificador si está seguro; si no, (None, None, 0)"""
+        clasificador = self.obtener_clasificador(base)
+        sistema, cobertura = clasificador.clasificar(nombre_iso)
+        if sistema and cobertura >= COBERTURA_CLASIFICADOR:
+            clave = self._clasificador[2].get(sistema)
+            if clave in base:
+                return clave, sistema, cobertura
+        return None, None, 0.0
+
+    def obtener_estado(self):
+        """Estado de escaneo persistente, cargado una vez por ejecución"""
+        if self._estado is None:
+            self._estado = EstadoEscaneo()
+        return self._estado
+
+    def obtener_catalogo(self):
+        """Catálogo de temas, cargado y actualizado una vez por ejecución"""
+        if self._catalogo is None:
+            self._catalogo = CatalogoTemas()
+        self._catalogo.actualizar()
+        if not (self.solo_lectura or self.simular):
+            self._catalogo.guardar()
+        return self._catalogo
+
+    def raiz(self):
+        """Raíz del USB donde están las imágenes"""
+        return self.raiz_usb or os.path.dirname(os.getcwd())
+
+    def ruta_iso(self, archivo):
+        """Ruta de una ISO a partir de su ruta relativa a la raíz del USB"""
+        return os.path.join(self.raices_isos.get(archivo) or self.raiz(), archivo)
+
+    def obtener_menu_class(self, config):
+        """Modelo indexado del menu_class de la configuración, compartido por todo el proceso"""
+        if self._menu_class is None or self._menu_class[0] is not config:
+            menu_class = MenuClass(config.get("menu_class", []))
+            menu_class.expandir(self.listar_isos(), self.obtener_estado().isos)
+            self._menu_class = (config, menu_class)
+        return self._menu_class[1]
+
+    def guardar_menu_class(self, config, menu_class):
+        """Vuelca el modelo al menu_class de la configuración"""
+        config["menu_class"] = menu_class.como_lista()
+        self._menu_class = (config, menu_class)
+
+    def calcular_isos_nuevas(self, config, isos_en_raiz):
+        """ISOs sin entrada en menu_class o reemplazadas desde que se resolvieron"""
+        menu_class = self.obtener_menu_class(config)
+        estado = self.obtener_estado()
+        return [f for f in isos_en_raiz
+                if clave_iso(f) not in menu_class or estado.cambio(f, self.ruta_iso(f))]
+
+    def obtener_indice_iconos(self, tema):
+        """Devuelve el índice de iconos del tema, reconstruyéndolo si cambió la carpeta"""
+        iconos_path = os.path.join("Themes", tema, "icons")
+        try:
+            info = os.stat(iconos_path)
+        except OSError:
+            info = None
+        if info is None or not stat.S_ISDIR(info.st_mode):
+            self._indices_iconos.pop(tema, None)
+            return None
+
+        indice = self._indices_iconos.get(tema)
+        if indice is None or indice.mtime != info.st_mtime_ns:
+            indice = IndiceIconos(iconos_path)
+            self._indices_iconos[tema] = indice
+        return indice
+
+    def guardar_base_datos(self, base):
+        """Guardar cambios a la base de datos (una sola escritura por ejecución)"""
+        if not self._base_modificada:
+            return
+        datos = dict(base)
+        escribir_json_atomico("base_datos.json", datos)
+        try:
+            guardar_indice_base("base_datos.json", "base_datos.idx", datos)
+        except OSError:
+            pass  # Índice en uso o USB de solo lectura: se recompila en el próximo arranque
+        self._base_modificada = False
+
+    def compactar_config(self, config, archivos, prefijo=""):
+        """Copia de la configuración con menu_class compactado, verificado contra las imágenes dadas"""
+        entradas = config.get("menu_class", [])
+        if not entradas:
+            return config
+        menu_class = MenuClass(entradas)
+        reglas, objetivo = compactar_menu_class(menu_class.clases, archivos)
+        if reglas is None:
+            print(f"{prefijo}menu_class: no se puede compactar sin cambiar la clase de alguna imagen, "
+                  f"se deja una entrada por imagen")
+            return config
+        por_imagen = [(e["key"], e["class"]) for e in entradas if "key" in e]
+        comparaciones = [sum(clase_en_arranque(n, r)[1] for n in objetivo) for r in (por_imagen, reglas)]
+        print(f"{prefijo}menu_class compactado: {len(por_imagen)} entradas -> {len(reglas)} reglas, "
+              f"{comparaciones[0]} -> {comparaciones[1]} comparaciones en el arranque; "
+              f"las {len(objetivo)} imágenes conservan su clase")
+        tapadas = verificar_reglas(por_imagen, objetivo)
+        if tapadas:
+            print(f"{prefijo}  con una entrada por imagen Ventoy daba otra clase a: {', '.join(tapadas)}")
+        return dict(config, menu_class=[{"key": k, "class": c} for k, c in reglas] + menu_class.otras)
+
+    def escribir_config(self, config, ruta_json, prefijo="", archivos=None):
+        """Escribe Ventoy.Json solo si el plan de cambios no está vacío (nunca al simular)"""
+        if self.compactar:
+            config = self.compactar_config(config, self.listar_isos() if archivos is None else archivos, prefijo)
+        try:
+            with open(ruta_json, "r", encoding="utf-8") as f:
+                actual = json.load(f)
+        except (OSError, ValueError):
+            actual = {}
+        plan = diferencia_config(actual, config)
+        self.planes.append(dict(plan, archivo=os.path.abspath(ruta_json)))
+        print(f"{prefijo}{'Plan para' if self.simular else 'Cambios en'} Ventoy.Json: {describir_plan(plan)}")
+        if self.simular or plan_vacio(plan):
+            return False
+        return escribir_json_atomico(ruta_json, config)
+
+    def guardar_cambios(self, config, ruta_json, base, isos_actuales):
+        """Escribe Ventoy.Json, la base de datos y el estado de escaneo al final del proceso"""
+        self.escribir_config(config, ruta_json, archivos=isos_actuales)
+        if self.simular:
+            return
+        self.guardar_base_datos(base)
+        estado = self.obtener_estado()
+        estado.podar(isos_actuales)
+        estado.guardar()
+
+    def cargar_ventoy_json(self):
+        """Leer Ventoy.Json"""
+        ruta = "Ventoy.Json"
+        if not os.path.isfile(ruta):
+            self.mostrar_error("Error", "No se encontró Ventoy.Json")
+            return None, ruta
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f), ruta
+
+    def obtener_tema(self, config):
+        """Obtener tema actual desde el JSON"""
+        ruta = config.get("theme", {}).get("file", "")
+        # El USB es FAT/exFAT: Ventoy acepta /Ventoy/Themes/ y /ventoy/themes/ por igual
+        match = re.search(r"/ventoy/themes/([^/]+)/", ruta, re.IGNORECASE)
+        if not match:
+            return None
+        tema = match.group(1)
+        if tema not in self.obtener_catalogo().temas:
+            for disponible in self.obtener_catalogo().temas:
+                if disponible.lower() == tema.lower():
+                    return disponible
+        return tema
+
+    def listar_isos(self, refrescar=False):
+        """Listar las imágenes del USB (también en subcarpetas), recorriéndolo una vez por ejecución"""
+        if self._isos is None or refrescar:
+            estado = self.obtener_estado()
+            self._directorios_isos = []
+            self._isos = []
+            for archivo, info in recorrer_imagenes(self.raiz(), self.extensiones,
+                                                   self.excluir, self._directorios_isos):
+                estado.precargar(archivo, info)
+                self._isos.append(archivo)
+        return self._isos
+
+    def listar_temas_disponibles(self):
+        """Listar temas disponibles en la carpeta Themes"""
+        return sorted(self.obtener_catalogo().temas)
+
+    def info_tema(self, tema):
+        """Metadatos del tema según el catálogo (None si no existe)"""
+        return self.obtener_catalogo().temas.get(tema)
+
+    def fuentes_json(self, config):
+        """Nombres de las fuentes .pf2 que Ventoy.Json carga con theme.fonts"""
+        nombres = []
+        for ruta in config.get("theme", {}).get("fonts", []):
+            # Rutas absolutas del USB (/ventoy/...), relativas a esta carpeta
+            relativa = re.sub(r"^/ventoy/", "", ruta, flags=re.IGNORECASE)
+            nombre = leer_nombre_pf2(self.ruta_sin_mayusculas(relativa))
+            if nombre:
+                nombres.append(nombre)
+        return nombres
+
+    @staticmethod
+    def ruta_sin_mayusculas(relativa, base="."):
+        """Resuelve una ruta ignorando mayúsculas, como hace FAT/exFAT en el USB"""
+        actual = base
+        for parte in relativa.split("/"):
+            candidata = os.path.join(actual, parte)
+            if not os.path.exists(candidata):
+                try:
+                    candidata = next((os.path.join(actual, n) for n in os.listdir(actual)
+                                      if n.lower() == parte.lower()), candidata)
+                except OSError:
+                    pass
+            actual = candidata
+        return actual
+
+    def problemas_tema(self, tema, config=None):
+        """(problemas, avisos) del tema: los problemas impiden aplicarlo"""
+        info = self.info_tema(tema)
+        if info is None:
+            return [f"El tema '{tema}' no existe o no tiene theme.txt"], []
+        disponibles = set(info["fuentes_tema"]) | set(self.fuentes_json(config or {}))
+        avisos = [f"Fuente '{f}' no disponible (GRUB usará la predeterminada)"
+                  for f in info["fuentes"] if f not in disponibles]
+        return list(info["problemas"]), avisos
+
+    def describir_tema(self, tema):
+        """Resumen corto del tema para listas y selectores"""
+        info = self.info_tema(tema)
+        if info is None:
+            return tema
+        detalles = [f"{info['iconos']} iconos"]
+        if info["resolucion"]:
+            detalles.insert(0, info["resolucion"])
+        if info["problemas"]:
+            detalles.append("con errores")
+        return f"{tema} ({', '.join(detalles)})"
+
+    def detectar_sistema_automatico(self, nombre_iso, base):
+        """Detecta automáticamente el sistema operativo basándose en el nombre del archivo ISO"""
+        nombre = normalizar_nombre(nombre_iso)
+        
+        # Buscar coincidencias exactas primero
+        for parte in nombre.partes:
+            if parte in base:
+                return parte, base[parte][0]
+        
+        # Buscar coincidencias parciales (claves y valores) con el índice compilado;
+        # si no encuentra nada devuelve (None, None)
+        return self.obtener_indice_deteccion(base).buscar(nombre.minusculas)
+
+    def detectar_por_contenido(self, iso_archivo, base):
+        """Detecta el sistema a partir de las etiquetas de volumen de la imagen"""
+        etiquetas = self.obtener_estado().etiquetas(iso_archivo, self.ruta_iso(iso_archivo))
+        for campo in ("volumen_joliet", "volumen_udf", "volumen", "volumen_logico_udf",
+                      "aplicacion", "editor", "sistema", "el_torito"):
+            texto = etiquetas.get(campo)
+            if texto:
+                clave, sistema = self.detectar_sistema_automatico(texto, base)
+                if clave:
+                    return clave, sistema
+        return None, None
+
+    def puntuar_iconos(self, tema, nombre_iso, equivalentes):
+        """Iconos del tema compatibles con la ISO con su puntuación (0 a 1), de mayor a menor"""
+        indice = self.obtener_indice_iconos(tema)
+        if indice is None:
+            return []
+        nombre = normalizar_nombre(nombre_iso)
+        partes = nombre.significativos
+
+        # 1. Candidatos: iconos que contienen una parte o están contenidos en ella
+        #    (las partes y los iconos de menos de 3 letras solo cuentan si coinciden enteros)
+        posiciones = set()
+        for parte in partes:
+            if len(parte) >= 3:
+                posiciones.update(indice.que_contienen(parte))
+                posiciones.update(i for i in indice.contenidos_en(parte) if len(indice.comprimidos[i]) >= 3)
+            posiciones.update(indice.exactos(parte))
+
+        # 2. Candidatos por equivalencias desde la base
+        equivalentes = [normalizar_nombre(e) for e in equivalentes if e]
+        for equivalente in equivalentes:
+            posiciones.update(indice.que_contienen(equivalente.minusculas))
+
+        puntuados = []
+        for i in posiciones:
+            puntuacion = self._puntuar_icono(indice.tokens[i], indice.comprimidos[i], indice.iconos[i].lower(),
+                                             nombre, equivalentes)
+            puntuados.append((indice.iconos[i], puntuacion, i))
+        # Empates en el orden del listado de la carpeta
+        puntuados.sort(key=lambda c: (-c[1], c[2]))
+        return [(icono, puntuacion) for icono, puntuacion, _ in puntuados]
+
+    @staticmethod
+    def _puntuar_icono(tokens_icono, comprimido, icono, nombre, equivalentes):
+        """Solapamiento de tokens, peso de equivalencia de la base y distancia de edición"""
+        def parecido(a, b):
+            # Las cifras distinguen variantes: "win11" es "windows11" entero, no un trozo de "windows"
+            if a == b or misma_version(a, b):
+                return 1.0
+            if a in b or b in a:
+                return min(len(a), len(b)) / max(len(a), len(b))
+            return 0.0
+
+        # Cobertura del icono: sus tokens aparecen en el nombre (o en el sistema detectado)
+        partes = nombre.significativos
+        conocidos = partes + tuple(t for e in equivalentes for t in e.significativos)
+        cobertura_icono = sum(max((parecido(t, p) for p in conocidos), default=0.0)
+                              for t in tokens_icono) / len(tokens_icono)
+        # Cobertura del nombre: un icono más específico ("ubuntu-mate") cubre más partes
+        cobertura_nombre = (sum(max(parecido(p, t) for t in tokens_icono) for p in partes) / len(partes)
+                            if partes else 0.0)
+
+        # Similitud de edición con la parte (o pareja de partes) más parecida
+        similitud = 0.0
+        for parte in nombre.comparables + tuple(e.comprimido for e in equivalentes):
+            largo = max(len(parte), len(comprimido))
+            if largo:
+                similitud = max(similitud, 1 - distancia_edicion(parte, comprimido) / largo)
+
+        puntuacion = 0.30 * cobertura_icono + 0.30 * cobertura_nombre + 0.15 * similitud
+        if not equivalentes:
+            return puntuacion / 0.75
+
+        # Equivalencia: el primer valor de la base es el preferido
+        equivalencia = 0.0
+        for posicion, equivalente in enumerate(e.minusculas for e in equivalentes):
+            if icono == equivalente:
+                valor = 1.0 - 0.1 * posicion
+            elif equivalente in icono:
+                # Variante más específica del sistema; vale casi igual si el nombre la confirma
+                valor = 0.9 if cobertura_icono == 1.0 else 0.5
+            elif icono in equivalente:
+                valor = 0.3
+            else:
+                continue
+            equivalencia = max(equivalencia, valor)
+        return puntuacion + 0.25 * equivalencia
+
+    def candidatos_icono(self, tema, nombre_iso, equivalentes):
+        """Iconos del tema compatibles con la ISO, en orden de preferencia"""
+        return [icono for icono, _ in self.puntuar_iconos(tema, nombre_iso, equivalentes)]
+
+    def buscar_icono_por_partes(self, tema, nombre_iso, equivalentes):
+        """Busca iconos disponibles y maneja múltiples coincidencias"""
+        puntuados = self.puntuar_iconos(tema, nombre_iso, equivalentes)
+
+        # Manejar resultados: solo se pregunta si ningún icono destaca
+        icono = elegir_automatico(puntuados)
+        if icono:
+            return icono
+        elif len(puntuados) > 1:
+            return self.elegir_icono_usuario([i for i, _ in puntuados], nombre_iso)
+        
+        return None
+
+    def aplicar_tema(self, config, nuevo_tema):
+        """Cambia el tema solo en memoria (se escribe junto con el resto de cambios)"""
+        config["theme"]["file"] = f"/Ventoy/Themes/{nuevo_tema}/theme.txt"
+
+    def cambiar_tema(self, config, nuevo_tema, ruta_json):
+        """Cambia el tema en la configuración"""
+        self.aplicar_tema(config, nuevo_tema)
+        self.escribir_config(config, ruta_json)
+        
+        print(f"Tema cambiado a: {nuevo_tema}")
+        return True
+
+    def resolver_iso(self, iso_archivo, tema, version, base, anteriores=None):
+        """Fase 1: detecta el sistema y busca icono para una ISO sin preguntar nada"""
+        resolucion = ResolucionIso(iso_archivo)
+        estado = self.obtener_estado()
+        ruta_iso = self.ruta_iso(iso_archivo)
+
+        # Reutilizar la resolución guardada si la ISO y los iconos no cambiaron
+        clase_guardada = estado.clase(iso_archivo, ruta_iso, tema, version)
+        entrada = estado.entrada(iso_archivo, ruta_iso)
+        if clase_guardada:
+            resolucion.clave, resolucion.sistema = entrada.get("clave"), entrada.get("sistema")
+            resolucion.clase = clase_guardada
+            resolucion.reutilizada = True
+            return resolucion
+
+        # Una ISO renombrada o movida hereda la resolución de la que tenía su mismo contenido
+        anterior = estado.identidad(iso_archivo, ruta_iso) if self.identidad_contenido else None
+        if anterior:
+            resuelta = anterior["clases"].get(tema)
+            if resuelta and resuelta["version"] == version:
+                resolucion.clave, resolucion.sistema = anterior["clave"], anterior["sistema"]
+                resolucion.clase = resuelta["clase"]
+                resolucion.heredada = anterior["archivo"]
+                return resolucion
+            if anterior.get("clave") in base:
+                entrada = anterior
+
+        # Detectar sistema (detección guardada, por nombre y, si se pidió, por contenido)
+        if entrada and entrada.get("clave") in base:
+            clave, sistema = entrada["clave"], entrada["sistema"]
+        else:
+            clave, sistema = self.detectar_sistema_automatico(resolucion.nombre, base)
+            if not clave and self.detectar_contenido:
+                clave, sistema = self.detectar_por_contenido(iso_archivo, base)
+            if not clave and self.usar_clasificador:
+                clave, sistema, cobertura = self.clasificar_nombre(resolucion.nombre, base)
+                resolucion.clasificada = cobertura if clave else None
+        resolucion.clave, resolucion.sistema = clave, sistema
+
+        if clave:
+            equivalentes = base[clave]
+        elif anteriores is not None and anteriores.get(resolucion.nombre):
+            # Al rescanear, la clase de la configuración actual sirve de equivalencia
+            equivalentes = [anteriores.get(resolucion.nombre)]
+        else:
+            equivalentes = []
+
+        puntuados = self.puntuar_iconos(tema, resolucion.nombre, equivalentes)
+        resolucion.candidatos = [icono for icono, _ in puntuados]
+        elegido = elegir_automatico(puntuados)
+        # Una ISO sin sistema detectado queda pendiente si luego hay que preguntarlo
+        if elegido and (clave or anteriores is not None):
+            resolucion.clase = elegido
+        return resolucion
+
+    def resolver_isos(self, isos, tema, base, anteriores=None):
+        """Fase 1 en paralelo: resuelve todas las ISOs que no necesitan al usuario"""
+        indice = self.obtener_indice_iconos(tema)
+        version = indice.version if indice else None
+        # Dejar los índices compilados antes de repartir el trabajo entre hilos
+        self.obtener_indice_deteccion(base).buscar("")
+        from concurrent.futures import ThreadPoolExecutor  # Solo al resolver, no en el arranque
+        with ThreadPoolExecutor(max_workers=self.hilos) as pool:
+            if self.identidad_contenido:
+                self.calcular_huellas(pool)
+            return list(pool.map(lambda f: self.resolver_iso(f, tema, version, base, anteriores), isos))
+
+    def calcular_huellas(self, pool):
+        """Calcula (o toma del estado) la huella de todas las ISOs del USB"""
+        estado = self.obtener_estado()
+        isos = self.listar_isos()
+        list(pool.map(lambda f: estado.huella(f, self.ruta_iso(f)), isos))
+
+    def revisar_resoluciones(self, resoluciones, tema, base, preguntar_sistema=True):
+        """Fase 2: resuelve todas las ISOs pendientes (sin interfaz, con las políticas de --batch)"""
+        for resolucion in resoluciones:
+            if resolucion.pendiente:
+                self.revisar_resolucion(resolucion, tema, base, preguntar_sistema)
+
+    def revisar_resolucion(self, resolucion, tema, base, preguntar_sistema=True):
+        """Resuelve una ISO pendiente con las políticas si_ambiguo y si_falta (la interfaz usa la tabla)"""
+        print(f"Revisando: {resolucion.nombre}")
+        if not resolucion.clave and preguntar_sistema:
+            print(f"  - No detectado automáticamente, aplicando la política si_falta ({self.si_falta})...")
+            resolucion.clave, resolucion.sistema = self.preguntar_sistema_operativo(resolucion.nombre, base)
+            equivalentes = [resolucion.sistema] if resolucion.sistema != "unknown" else []
+            puntuados = self.puntuar_iconos(tema, resolucion.nombre, equivalentes)
+            resolucion.candidatos = [icono for icono, _ in puntuados]
+            icono_usado = elegir_automatico(puntuados)
+        else:
+            icono_usado = resolucion.candidatos[0] if len(resolucion.candidatos) == 1 else None
+
+        if not icono_usado and len(resolucion.candidatos) > 1:
+            icono_usado = self.elegir_icono_usuario(resolucion.candidatos, resolucion.nombre)
+
+        if not icono_usado:
+            print(f"  - No se encontró icono, gestionando...")
+            icono_usado = self.gestionar_icono_faltante(tema, resolucion.nombre, resolucion.sistema)
+
+        resolucion.clase = icono_usado or ""
+
+    def registrar_resoluciones(self, resoluciones, tema, menu_class):
+        """Vuelca las resoluciones al menu_class y al estado de escaneo"""
+        estado = self.obtener_estado()
+        indice = self.obtener_indice_iconos(tema)
+        version = indice.version if indice else None
+        reutilizadas = sin_revisar = 0
+        for resolucion in resoluciones:
+            if resolucion.pendiente:
+                # Sin confirmar en la tabla: fuera del JSON, vuelve a salir como nueva
+                sin_revisar += 1
+                continue
+            menu_class[resolucion.nombre] = resolucion.clase
+            if resolucion.reutilizada:
+                reutilizadas += 1
+                continue
+            if resolucion.heredada == resolucion.archivo:
+                print(f"  - {resolucion.nombre}: solo cambió la fecha, mismo contenido -> icono {resolucion.clase}")
+            elif resolucion.heredada:
+                print(f"  - {resolucion.nombre}: mismo contenido que {resolucion.heredada} -> icono {resolucion.clase}")
+            elif resolucion.clasificada:
+                print(f"  - {resolucion.nombre}: {resolucion.sistema} (clasificador, {resolucion.clasificada:.0%} "
+                      f"de coincidencia) -> icono {resolucion.clase}")
+            else:
+                print(f"  - {resolucion.nombre}: {resolucion.sistema or 'no detectado'} -> icono {resolucion.clase}")
+            estado.registrar(resolucion.archivo, self.ruta_iso(resolucion.archivo), resolucion.clave,
+                             resolucion.sistema, tema, version, resolucion.clase)
+        if reutilizadas:
+            print(f"ISOs sin cambios desde el último escaneo: {reutilizadas}")
+        if sin_revisar:
+            print(f"ISOs sin revisar (se volverán a mostrar en el próximo escaneo): {sin_revisar}")
+
+    def actualizar_json(self, config, nuevas_isos, tema, base, ruta_json):
+        """Actualiza el JSON con las nuevas ISOs detectadas"""
+        existentes = self.obtener_menu_class(config)
+        archivos_actuales = self.listar_isos()
+        
+        print(f"Procesando {len(nuevas_isos)} nuevas ISOs...")
+
+        # 1. Detectar y buscar iconos de todas las ISOs en paralelo
+        resoluciones = self.resolver_isos(nuevas_isos, tema, base)
+
+        # 2. Revisar de una vez las que necesitan al usuario
+        self.revisar_resoluciones(resoluciones, tema, base)
+        self.registrar_resoluciones(resoluciones, tema, existentes)
+        
+        # Limpiar entradas que ya no existen
+        existentes.conservar(clave_iso(f) for f in archivos_actuales)
+        
+        # Actualizar configuración
+        self.guardar_menu_class(config, existentes)
+        self.guardar_cambios(config, ruta_json, base, archivos_actuales)
+        if self.simular:
+            return
+        
+        self.mostrar_info("Éxito", f"Ventoy.Json actualizado correctamente.\nProcesadas {len(nuevas_isos)} ISOs nuevas.")
+
+    def rescanear_iconos_tema(self, config, tema, base, ruta_json):
+        """Rescanea todos los iconos para el nuevo tema"""
+        print(f"Rescaneando iconos para tema: {tema}")
+        
+        # Obtener todas las ISOs existentes
+        isos_existentes = self.listar_isos()
+        anteriores = self.obtener_menu_class(config)
+        
+        # Actualizar iconos para todas las ISOs
+        nuevos_iconos = MenuClass()
+        nuevos_iconos.otras = anteriores.otras
+        resoluciones = self.resolver_isos(isos_existentes, tema, base, anteriores)
+        self.revisar_resoluciones(resoluciones, tema, base, preguntar_sistema=False)
+        self.registrar_resoluciones(resoluciones, tema, nuevos_iconos)
+        
+        # Actualizar configuración
+        self.guardar_menu_class(config, nuevos_iconos)
+        self.guardar_cambios(config, ruta_json, base, isos_existentes)
+        if self.simular:
+            return
+        
+        self.mostrar_info("Éxito", f"Iconos rescaneados para tema '{tema}'.\nActualizadas {len(nuevos_iconos)} ISOs.")
+
+    def aplicar_cambios_isos(self, config, agregadas, eliminadas, tema, base, ruta_json, isos_actuales):
+        """Resuelve solo las ISOs agregadas y quita las eliminadas, sin rescanear el resto"""
+        menu_class = self.obtener_menu_class(config)
+        vigentes = {clave_iso(f) for f in isos_actuales}
+        for archivo in eliminadas:
+            # Otra imagen con el mismo nombre en otra carpeta conserva la entrada
+            if clave_iso(archivo) not in vigentes:
+                menu_class.quitar(clave_iso(archivo))
+        if agregadas:
+            resoluciones = self.resolver_isos(agregadas, tema, base)
+            self.revisar_resoluciones(resoluciones, tema, base)
+            self.registrar_resoluciones(resoluciones, tema, menu_class)
+        self.guardar_menu_class(config, menu_class)
+        self.guardar_cambios(config, ruta_json, base, isos_actuales)
+
+    def vigilar(self, intervalo=1.0, espera=3.0):
+        """Modo --watch: aplica al instante las ISOs que se copian o borran del USB"""
+        base = self.cargar_base_datos()
+        config, ruta_json = self.cargar_ventoy_json()
+        if not config:
+            return 1
+        tema = self.obtener_tema(config)
+        if not tema:
+            self.mostrar_error("Error", "No se pudo detectar el tema actual")
+            return 1
+
+        parent_dir = self.raiz()
+        iconos_dir = os.path.join(os.getcwd(), "Themes", tema, "icons")
+        menu_class = self.obtener_menu_class(config)
+
+        # Sincronización inicial: lo que cambió mientras no se vigilaba
+        conocidas = set(self.listar_isos())
+        nombres = {clave_iso(f) for f in conocidas}
+        eliminadas = [f"{clave}.iso" for clave in list(menu_class.clases) if clave not in nombres]
+        try:
+            self.aplicar_cambios_isos(config, self.calcular_isos_nuevas(config, sorted(conocidas)),
+                                      eliminadas, tema, base, ruta_json, conocidas)
+        except ErrorResolucion as e:
+            self.mostrar_error("Sin resolver", f"{e}. No se modificó Ventoy.Json")
+
+        vigilante = crear_vigilante(self._directorios_isos + ([iconos_dir] if os.path.isdir(iconos_dir) else []))
+        print(f"Vigilando {parent_dir} ({type(vigilante).__name__}). Ctrl+C para salir.")
+        pendientes = {}         # ISO -> ((tamaño, mtime), instante en que se vio así) o None
+        iconos_cambiados = False
+        ultimo_evento = 0.0
+        try:
+            while True:
+                cambios = vigilante.esperar(intervalo)
+                ahora = time.monotonic()
+                for directorio, nombre in cambios:
+                    if directorio is None:
+                        # Cola de inotify desbordada: comparar con un listado nuevo del USB
+                        actuales = set(self.listar_isos(refrescar=True))
+                        for archivo in (conocidas - actuales) | set(self.calcular_isos_nuevas(config, sorted(actuales))):
+                            pendientes.setdefault(archivo, None)
+                        for carpeta in self._directorios_isos:
+                            vigilante.agregar(carpeta)
+                        iconos_cambiados = True  # También pudieron perderse eventos del tema
+                        ultimo_evento = ahora
+                        continue
+                    if directorio == iconos_dir:
+                        if nombre.endswith(".png"):
+                            iconos_cambiados = True
+                            ultimo_evento = ahora
+                        continue
+                    ruta = os.path.join(directorio, nombre)
+                    relativa = os.path.relpath(ruta, parent_dir).replace(os.sep, "/")
+                    if _excluida(relativa, self.excluir):
+                        continue
+                    if os.path.isdir(ruta):
+                        # Carpeta nueva: vigilarla y encolar las imágenes que ya tenga
+                        nuevas_carpetas = []
+                        for archivo, _ in recorrer_imagenes(parent_dir, self.extensiones, self.excluir,
+                                                            nuevas_carpetas, relativa):
+                            pendientes[archivo] = None
+                        for carpeta in nuevas_carpetas:
+                            vigilante.agregar(carpeta)
+                    elif nombre.lower().endswith(tuple(self.extensiones)):
+                        pendientes[relativa] = None
+                    else:
+                        # Carpeta borrada o movida: revisar las imágenes que contenía
+                        pendientes.update((f, None) for f in conocidas if f.startswith(relativa + "/"))
+                    ultimo_evento = ahora
+
+                # Agrupar ráfagas de eventos (copias de varias ISOs seguidas)
+                if (not pendientes and not iconos_cambiados) or ahora - ultimo_evento < espera:
+                    continue
+
+                agregadas, eliminadas = [], []
+                for archivo, vista in list(pendientes.items()):
+                    try:
+                        info = os.stat(self.ruta_iso(archivo))
+                    except FileNotFoundError:
+                        del pendientes[archivo]
+                        if archivo in conocidas:
+                            conocidas.discard(archivo)
+                            eliminadas.append(archivo)
+                        continue
+                    firma = (info.st_size, info.st_mtime_ns)
+                    if vista is None or vista[0] != firma:
+                        pendientes[archivo] = (firma, ahora)
+                    elif ahora - vista[1] >= espera:
+                        # Tamaño estable: la copia terminó
+                        del pendientes[archivo]
+                        conocidas.add(archivo)
+                        agregadas.append(archivo)
+
+                if iconos_cambiados:
+                    # Iconos nuevos en el tema: reintentar solo las ISOs sin icono propio
+                    iconos_cambiados = False
+                    agregadas += [f for f in conocidas if f not in agregadas
+                                  and menu_class.get(clave_iso(f)) in ("unknown", "")]
+
+                if agregadas or eliminadas:
+                    print(f"Cambios: {len(agregadas)} ISOs nuevas o modificadas, {len(eliminadas)} eliminadas")
+                    try:
+                        self.aplicar_cambios_isos(config, agregadas, eliminadas, tema, base,
+                                                  ruta_json, conocidas)
+                    except ErrorResolucion as e:
+                        self.mostrar_error("Sin resolver", f"{e}. No se modificó Ventoy.Json")
+                    menu_class = self.obtener_menu_class(config)
+        except KeyboardInterrupt:
+            print("Vigilancia terminada")
+        finally:
+            vigilante.cerrar()
+        return 0
+
+    def provisionar(self, destinos, copiar_tema=False):
+        """Aplica la configuración de esta carpeta a varios USB Ventoy montados, en paralelo"""
+        from concurrent.futures import ThreadPoolExecutor
+        base = self.cargar_base_datos()
+        config, _ = self.cargar_ventoy_json()
+        if not config:
+            return 1
+        tema = self.obtener_tema(config)
+        if not tema:
+            self.mostrar_error("Error", "No se pudo detectar el tema actual")
+            return 1
+        if copiar_tema and self.problemas_tema(tema, config)[0]:
+            self.mostrar_error("Tema con errores", f"No se copia el tema '{tema}' a los USB")
+            return 1
+
+        errores = {}
+        detalles = {destino: [] for destino in destinos}
+
+        def por_destino(funcion):
+            """Ejecuta la tarea de un USB y guarda el error sin detener a los demás"""
+            def tarea(destino):
+                if destino in errores:
+                    return None
+                try:
+                    return funcion(destino)
+                except Exception as e:
+                    errores[destino] = f"{type(e).__name__}: {e}"
+                    print(f"[{destino}] Error: {e}", file=sys.stderr)
+                    return None
+            return tarea
+
+        def listar(destino):
+            if not os.path.isdir(destino):
+                raise FileNotFoundError(f"No existe el punto de montaje {destino}")
+            isos = [archivo for archivo, _ in recorrer_imagenes(destino, self.extensiones, self.excluir)]
+            print(f"[{destino}] {len(isos)} imágenes")
+            return isos
+
+        with ThreadPoolExecutor(max_workers=len(destinos)) as pool:
+            # 1. Listar las imágenes de cada USB a la vez (cada uno es un dispositivo distinto)
+            listados = dict(zip(destinos, pool.map(por_destino(listar), destinos)))
+            validos = [d for d in destinos if listados[d] is not None]
+            if not validos:
+                self.mostrar_error("Error", "No se pudo leer ningún USB")
+                return 3
+
+            # 2. Resolver una sola vez el conjunto común (unión) de imágenes; el estado de
+            # escaneo va aparte para no mezclar los archivos de estos USB con los del propio.
+            # Cada imagen se lee en el primer USB que la tiene
+            self.raiz_usb = validos[0]
+            self._estado = EstadoEscaneo("estado_provision.json")
+            for destino in reversed(validos):
+                self.raices_isos.update((archivo, destino) for archivo in listados[destino])
+            todas = sorted(self.raices_isos)
+            self._isos = todas
+            menu_class = self.obtener_menu_class(config)
+            nuevas = self.calcular_isos_nuevas(config, todas)
+            print(f"Imágenes distintas: {len(todas)}, por resolver: {len(nuevas)}")
+            try:
+                resoluciones = self.resolver_isos(nuevas, tema, base)
+                self.revisar_resoluciones(resoluciones, tema, base)
+            except ErrorResolucion as e:
+                self.mostrar_error("Sin resolver", f"{e}. No se modificó ningún USB")
+                return 2
+            self.registrar_resoluciones(resoluciones, tema, menu_class)
+            if not self.simular:
+                self.guardar_base_datos(base)
+                estado = self.obtener_estado()
+                estado.podar(todas)
+                estado.guardar()
+
+            # 3. Escribir (y copiar el tema) en todos los USB a la vez
+            def escribir(destino):
+                carpeta = self.ruta_sin_mayusculas("ventoy", destino)
+                if not self.simular:
+                    os.makedirs(carpeta, exist_ok=True)
+                if copiar_tema and not self.simular:
+                    copiados = copiar_carpeta(os.path.join("Themes", tema),
+                                              self.ruta_sin_mayusculas(f"Themes/{tema}", carpeta))
+                    detalles[destino].append(f"{copiados} archivos del tema copiados")
+                propio = MenuClass()
+                propio.otras = menu_class.otras
+                claves = {clave_iso(f) for f in listados[destino]}
+                propio.clases = {k: v for k, v in menu_class.clases.items() if k in claves}
+                config_destino = dict(config, menu_class=propio.como_lista())
+                escrito = self.escribir_config(config_destino, self.ruta_sin_mayusculas("Ventoy.Json", carpeta),
+                                               f"[{destino}] ", listados[destino])
+                detalles[destino].append("Ventoy.Json escrito" if escrito else
+                                         "simulado" if self.simular else "Ventoy.Json sin cambios")
+
+            list(pool.map(por_destino(escribir), destinos))
+
+        print("Resumen:")
+        for destino in destinos:
+            if destino in errores:
+                print(f"  FALLO {destino}: {errores[destino]}")
+            else:
+                print(f"  OK    {destino}: {', '.join(detalles[destino])}")
+        return 3 if errores else 0
+
+    def optimizar_iconos(self, quitar_sin_uso=False):
+        """Reduce los iconos del tema al tamaño de theme.txt, sin metadatos ni duplicados"""
+        from concurrent.futures import ProcessPoolExecutor  # Decodificar PNG es CPU: un proceso por núcleo
+        base = self.cargar_base_datos()
+        config, ruta_json = self.cargar_ventoy_json()
+        if not config:
+            return 1
+        tema = self.obtener_tema(config)
+        if not tema:
+            self.mostrar_error("Error", "No se pudo detectar el tema actual")
+            return 1
+        info = self.info_tema(tema) or {}
+        ancho = info.get("icono_ancho") or TAMANO_ICONO_GRUB
+        alto = info.get("icono_alto") or TAMANO_ICONO_GRUB
+        carpeta = os.path.join("Themes", tema, "icons")
+        try:
+            with os.scandir(carpeta) as entradas:
+                iconos = sorted(e.name for e in entradas if e.is_file() and e.name.lower().endswith(".png"))
+        except OSError as e:
+            self.mostrar_error("Error", f"No se pudo leer {carpeta}: {e}")
+            return 1
+        print(f"Tema '{tema}': {len(iconos)} iconos, tamaño de dibujo {ancho}x{alto}")
+
+        with ProcessPoolExecutor(max_workers=self.hilos) as pool:
+            rutas = [os.path.join(carpeta, icono) for icono in iconos]
+            resultados = dict(zip(iconos, pool.map(optimizar_png, rutas, [ancho] * len(rutas), [alto] * len(rutas))))
+
+        # Usos de cada icono en menu_class (Ventoy busca icons/<class>.png sin distinguir mayúsculas)
+        menu_class = self.obtener_menu_class(config)
+        usos = {}
+        for clase in list(menu_class.clases.values()) + [e.get("class") for e in menu_class.otras]:
+            if clase:
+                usos[clase.lower()] = usos.get(clase.lower(), 0) + 1
+        nombre = {icono: os.path.splitext(icono)[0] for icono in iconos}
+        # unknown.png y los iconos de sistemas de la base son los que buscan las ISOs futuras:
+        # nunca se fusionan ni se retiran aunque su imagen se repita
+        protegidos = {"unknown"}
+        for clave, valores in base.items():
+            protegidos.add(clave.lower())
+            protegidos.update(v.lower() for v in valores if v)
+
+        # Duplicados: sus entradas pasan a apuntar al icono conservado (uno protegido si lo hay,
+        # nunca unknown) y el archivo se aparta; los protegidos solo se informan
+        grupos = {}
+        for icono, resultado in resultados.items():
+            if resultado["error"]:
+                print(f"  {icono}: no se pudo analizar ({resultado['error']})")
+            else:
+                grupos.setdefault(resultado["huella"], []).append(icono)
+        duplicados, repetidos = {}, {}
+        for miembros in grupos.values():
+            miembros.sort(key=lambda i: (nombre[i].lower() == "unknown", nombre[i].lower() not in protegidos,
+                                         -usos.get(nombre[i].lower(), 0), len(i), i))
+            for icono in miembros[1:]:
+                if nombre[icono].lower() in protegidos:
+                    repetidos[icono] = miembros[0]
+                else:
+                    duplicados[icono] = miembros[0]
+        renombres = {nombre[d].lower(): nombre[c] for d, c in duplicados.items()}
+        for clave, clase in menu_class.clases.items():
+            if clase.lower() in renombres:
+                menu_class[clave] = renombres[clase.lower()]
+        menu_class.otras = [dict(e, **{"class": renombres[e["class"].lower()]})
+                            if e.get("class", "").lower() in renombres else e for e in menu_class.otras]
+        sin_uso = [i for i in iconos if i not in duplicados and nombre[i].lower() not in usos
+                   and nombre[i].lower() not in protegidos]
+
+        antes = sum(r["original"] for r in resultados.values())
+        despues = 0
+        for icono in iconos:
+            resultado = resultados[icono]
+            if icono in duplicados:
+                print(f"  {icono}: duplicado de {duplicados[icono]}, se aparta ({resultado['original']} bytes)")
+            elif quitar_sin_uso and icono in sin_uso:
+                print(f"  {icono}: sin uso en menu_class, se retira ({resultado['original']} bytes)")
+            else:
+                despues += resultado["nuevo"]
+                if resultado["datos"]:
+                    print(f"  {icono}: {resultado['original']} -> {resultado['nuevo']} bytes "
+                          f"({', '.join(resultado['acciones'])})")
+                if icono in repetidos:
+                    print(f"  {icono}: misma imagen que {repetidos[icono]}, se conserva (icono de un sistema)")
+        if sin_uso and not quitar_sin_uso:
+            print(f"  {len(sin_uso)} iconos sin uso en menu_class (--quitar-sin-uso para retirarlos)")
+        ahorro = antes - despues
+        print(f"Iconos: {antes} -> {despues} bytes, ahorro {ahorro} bytes "
+              f"({ahorro / antes if antes else 0:.0%}){' (simulado)' if self.simular else ''}")
+
+        if renombres:
+            self.guardar_menu_class(config, menu_class)
+            self.escribir_config(config, ruta_json)
+        if self.simular:
+            return 0
+        for icono, resultado in resultados.items():
+            if resultado["datos"] and icono not in duplicados and not (quitar_sin_uso and icono in sin_uso):
+                reemplazar_atomico(os.path.join(carpeta, icono), resultado["datos"])
+        # Duplicados y sin uso se apartan (no se borran) por si una ISO futura los necesita
+        retirados = list(duplicados) + (sin_uso if quitar_sin_uso else [])
+        if retirados:
+            apartados = os.path.join("Themes", tema, "icons_sin_usar")
+            os.makedirs(apartados, exist_ok=True)
+            for icono in retirados:
+                os.replace(os.path.join(carpeta, icono), os.path.join(apartados, icono))
+        self.obtener_catalogo().invalidar()
+        return 0
+
+    def mostrar_info(self, titulo, mensaje):
+        """Informa al usuario (en consola sin interfaz)"""
+        print(f"{titulo}: {mensaje}")
+
+    def mostrar_aviso(self, titulo, mensaje):
+        """Advierte al usuario (en consola sin interfaz)"""
+        print(f"Aviso - {titulo}: {mensaje}", file=sys.stderr)
+
+    def mostrar_error(self, titulo, mensaje):
+        """Reporta un error (en consola sin interfaz)"""
+        print(f"Error - {titulo}: {mensaje}", file=sys.stderr)
+
+    def icono_unknown(self, tema):
+        """Devuelve 'unknown' si el tema tiene unknown.png, o cadena vacía"""
+        ruta_unknown = os.path.join("Themes", tema, "icons", "unknown.png")
+        return "unknown" if os.path.isfile(ruta_unknown) else ""
+
+    def registrar_sistema(self, nombre_iso, sistema, base):
+        """Agrega a la base de datos la respuesta dada para una ISO"""
+        clave = normalizar_nombre(nombre_iso).comprimido
+        base[clave] = [sistema]
+        self.obtener_indice_deteccion(base).agregar(clave)
+        if self._clasificador is not None and self._clasificador[0] is base:
+            # La respuesta también enseña al clasificador (las siguientes versiones ya no preguntan)
+            self._clasificador[1].aprender(nombre_iso, sistema)
+            self._clasificador[2].setdefault(sistema, clave)
+        self._base_modificada = True  # Se escribe una vez en guardar_cambios
+        return clave
+
+    def elegir_icono_usuario(self, opciones, nombre_iso):
+        """Política si_ambiguo de --batch para varios iconos compatibles (la interfaz usa la tabla)"""
+        if self.si_ambiguo == "primero":
+            print(f"    - Varios iconos compatibles, usando el primero: {opciones[0]}")
+            return opciones[0]
+        if self.si_ambiguo == "fallar":
+            raise ErrorResolucion(f"Varios iconos compatibles con '{nombre_iso}': {', '.join(opciones)}")
+        return None
+
+    def gestionar_icono_faltante(self, tema, nombre_iso, clase_detectada=None):
+        """Política si_falta de --batch para una ISO sin icono: unknown si el tema lo tiene, o vacío"""
+        if self.si_falta == "fallar":
+            raise ErrorResolucion(f"No se encontró icono apropiado para '{nombre_iso}'")
+        return self.icono_unknown(tema)
+
+    def preguntar_sistema_operativo(self, nombre_iso, base):
+        """Política si_falta de --batch para una ISO no reconocida (la interfaz usa la tabla)"""
+        if self.si_falta == "fallar":
+            raise ErrorResolucion(f"No se pudo detectar el sistema de '{nombre_iso}'")
+        return None, "unknown"
+
+    def resumen_usb(self, config):
+        """Datos del menú principal y de --estado: ISOs totales y nuevas"""
+        isos_en_raiz = self.listar_isos()
+        nuevas_isos = self.calcular_isos_nuevas(config, isos_en_raiz)
+        return {
+            'total': len(isos_en_raiz),
+            'nuevas': len(nuevas_isos),
+            'lista_nuevas': nuevas_isos
+        }
 
-    def guardar_base_datos(self, base):
-        """Guardar cambios a la base de datos"""
-        with open("base_datos.json", "w", encoding="utf-8") as f:
-            json.dump(base, f, indent=4)
+    def mostrar_resumen(self):
+        """Modo --estado: muestra tema, temas e ISOs nuevas sin modificar nada"""
+        config, _ = self.cargar_ventoy_json()
+        if not config:
+            return 1
+        isos_info = self.resumen_usb(config)
+        print(f"Tema actual: {self.obtener_tema(config) or 'no detectado'}")
+        print("Temas disponibles:")
+        for tema in self.listar_temas_disponibles():
+            print(f"  - {self.describir_tema(tema)}")
+        print(f"ISOs totales: {isos_info['total']}")
+        print(f"ISOs nuevas: {isos_info['nuevas']}")
+        for iso in isos_info['lista_nuevas']:
+            print(f"  - {iso}")
+        return 0
 
-    def cargar_ventoy_json(self):
-        """Leer Ventoy.Json"""
-        ruta = "Ventoy.Json"
-        if not os.path.isfile(ruta):
-            messagebox.showerror("Error", "No se encontró Ventoy.Json")
-            return None, ruta
-        with open(ruta, "r", encoding="utf-8") as f:
-            return json.load(f), ruta
+    def validar_configuracion(self):
+        """Modo --validar: revisa Ventoy.Json y el tema sin modificar nada"""
+        problemas = []
+        try:
+            config, _ = self.cargar_ventoy_json()
+        except ValueError as e:
+            self.mostrar_error("Error", f"Ventoy.Json no es un JSON válido: {e}")
+            return 1
+        if not config:
+            return 1
 
-    def obtener_tema(self, config):
-        """Obtener tema actual desde el JSON"""
-        ruta = config.get("theme", {}).get("file", "")
-        match = re.search(r"/Ventoy/Themes/([^/]+)/", ruta)
-        return match.group(1) if match else None
+        tema = self.obtener_tema(config)
+        if not tema:
+            problemas.append("No se pudo detectar el tema en theme.file")
+        elif tema not in self.listar_temas_disponibles():
+            problemas.append(f"El tema '{tema}' no existe o no tiene theme.txt")
+        else:
+            problemas_tema, avisos = self.problemas_tema(tema, config)
+            problemas += problemas_tema
+            for aviso in avisos:
+                print(f"  Aviso: {aviso}")
+            indice = self.obtener_indice_iconos(tema)
+            for clase in sorted(set(self.obtener_menu_class(config).clases.values())):
+                if clase and (indice is None or clase not in indice):
+                    problemas.append(f"Falta el icono '{clase}.png' en el tema '{tema}'")
 
-    def listar_isos(self):
-        """Listar isos en la carpeta padre (raíz del USB)"""
-        parent_dir = os.path.dirname(os.getcwd())
-        return [f for f in os.listdir(parent_dir) if f.lower().endswith(".iso")]
+        for problema in problemas:
+            print(f"  - {problema}")
+        print("Configuración válida" if not problemas else f"{len(problemas)} problemas encontrados")
+        return 1 if problemas else 0
 
-    def listar_temas_disponibles(self):
-        """Listar temas disponibles en la carpeta Themes"""
-        themes_path = os.path.join("Themes")
-        if not os.path.isdir(themes_path):
-            return []
-        
-        temas = []
-        for item in os.listdir(themes_path):
-            theme_path = os.path.join(themes_path, item)
-            if os.path.isdir(theme_path):
-                theme_txt = os.path.join(theme_path, "theme.txt")
-                if os.path.isfile(theme_txt):
-                    temas.append(item)
-        return temas
+    def ejecutar_batch(self, nuevo_tema=None):
+        """Procesa las ISOs nuevas (y opcionalmente cambia de tema) sin interfaz"""
+        base = self.cargar_base_datos()
+        config, ruta_json = self.cargar_ventoy_json()
+        if not config:
+            return 1
 
-    def detectar_sistema_automatico(self, nombre_iso, base):
-        """Detecta automáticamente el sistema operativo basándose en el nombre del archivo ISO"""
-        nombre_lower = nombre_iso.lower()
-        
-        # Dividir el nombre en partes
-        partes = re.split(r"[-_.]+", nombre_lower)
-        
-        # Buscar coincidencias exactas primero
-        for parte in partes:
-            if parte in base:
-                return parte, base[parte][0]
-        
-        # Buscar coincidencias parciales
-        for clave, valores in base.items():
-            if clave in nombre_lower:
-                return clave, valores[0]
-            # También verificar si algún valor de la base está en el nombre
-            for valor in valores:
-                if valor in nombre_lower:
-                    return clave, valor
-        
-        # Si no encuentra nada, devolver None
-        return None, None
+        tema_actual = self.obtener_tema(config)
+        if not tema_actual:
+            self.mostrar_error("Error", "No se pudo detectar el tema actual")
+            return 1
 
-    def buscar_icono_por_partes(self, tema, nombre_iso, equivalentes):
-        """Busca iconos disponibles y maneja múltiples coincidencias"""
-        partes = re.split(r"[-_.]+", nombre_iso.lower())
-        iconos_path = os.path.join("Themes", tema, "icons")
-        
-        if not os.path.isdir(iconos_path):
-            return None
+        try:
+            if nuevo_tema and nuevo_tema != tema_actual:
+                if nuevo_tema not in self.listar_temas_disponibles():
+                    self.mostrar_error("Error", f"El tema '{nuevo_tema}' no está disponible")
+                    return 1
+                problemas, avisos = self.problemas_tema(nuevo_tema, config)
+                for aviso in avisos:
+                    self.mostrar_aviso("Tema", aviso)
+                if problemas:
+                    self.mostrar_error("Tema con errores", f"'{nuevo_tema}': " + "; ".join(problemas))
+                    return 1
+                # Tema y menu_class se escriben juntos: si una ISO falla, no se escribe nada
+                self.aplicar_tema(config, nuevo_tema)
+                self.rescanear_iconos_tema(config, nuevo_tema, base, ruta_json)
+                if not self.simular:
+                    print(f"Tema cambiado a: {nuevo_tema}")
+                return 0
 
-        disponibles = [f for f in os.listdir(iconos_path) if f.endswith(".png")]
+            nuevas_isos = self.calcular_isos_nuevas(config, self.listar_isos())
+            print(f"ISOs nuevas: {len(nuevas_isos)}")
+            if nuevas_isos:
+                self.actualizar_json(config, nuevas_isos, tema_actual, base, ruta_json)
+            else:
+                print("No hay nuevas ISOs para agregar.")
+                if self.compactar:
+                    self.guardar_menu_class(config, self.obtener_menu_class(config))
+                    self.escribir_config(config, ruta_json)
+        except ErrorResolucion as e:
+            self.mostrar_error("Sin resolver", f"{e}. No se modificó Ventoy.Json")
+            return 2
+        return 0
 
-        # 1. Buscar coincidencias directas con partes del nombre
-        coincidencias = []
-        for archivo in disponibles:
-            nombre_archivo = os.path.splitext(archivo)[0].lower()
-            for parte in partes:
-                if parte in nombre_archivo or nombre_archivo in parte:
-                    coincidencias.append(os.path.splitext(archivo)[0])
-                    break
-        
-        # Eliminar duplicados manteniendo el orden
-        coincidencias = list(dict.fromkeys(coincidencias))
-        
-        # 2. Buscar por equivalencias desde la base
-        for equivalente in equivalentes:
-            for archivo in disponibles:
-                nombre_archivo = os.path.splitext(archivo)[0].lower()
-                if equivalente in nombre_archivo:
-                    icono_equiv = os.path.splitext(archivo)[0]
-                    if icono_equiv not in coincidencias:
-                        coincidencias.append(icono_equiv)
-
-        # Manejar resultados
-        if len(coincidencias) == 1:
-            return coincidencias[0]
-        elif len(coincidencias) > 1:
-            return self.elegir_icono_usuario(coincidencias, nombre_iso)
-        
-        return None
+class CargadorMiniaturas:
+    """Miniaturas PNG para las ventanas: lectura en segundo plano y caché LRU de PhotoImage"""
 
-    def elegir_icono_usuario(self, opciones, nombre_iso):
-        """Ventana para elegir entre múltiples iconos disponibles"""
-        print(f"    - Mostrando ventana de selección de icono...")
-        
-        # Asegurar que la ventana root esté visible
-        self.root.deiconify()
-        self.root.update()
-        
-        resultado = [None]  # Usar lista para poder modificar desde funciones internas
-        
-        def seleccionar(opcion):
-            print(f"    - Usuario seleccionó icono: {opcion}")
-            resultado[0] = opcion
-            ventana.destroy()
+    def __init__(self, raiz, capacidad=256):
+        from concurrent.futures import ThreadPoolExecutor
+        import queue
+        self.raiz = raiz
+        self.capacidad = capacidad
+        self._cache = OrderedDict()  # (ruta, mtime, tamaño) -> PhotoImage (o None si no se pudo leer)
+        self._pedidos = {}           # clave -> funciones a llamar con la imagen
+        self._listos = queue.Queue() # (clave, datos en base64, medidas) leídos por el hilo
+        self._hilos = ThreadPoolExecutor(max_workers=2)
+        self._sondeando = False
 
-        def cancelar():
-            print("    - Usuario canceló selección")
-            resultado[0] = None
-            ventana.destroy()
+    def pedir(self, ruta, tamano, al_cargar):
+        """Llama a al_cargar(imagen) en el hilo de Tk cuando la miniatura esté lista.
 
-        ventana = tk.Toplevel(self.root)
-        ventana.title(f"Elegir icono para {nombre_iso}")
-        ventana.geometry("400x300")
-        ventana.resizable(False, False)
-        
-        # Forzar que aparezca la ventana
-        ventana.lift()
-        ventana.attributes('-topmost', True)
-        
-        # Centrar la ventana
-        ventana.update_idletasks()
-        x = (ventana.winfo_screenwidth() // 2) - (400 // 2)
-        y = (ventana.winfo_screenheight() // 2) - (300 // 2)
-        ventana.geometry(f"400x300+{x}+{y}")
-        
-        ventana.transient(self.root)
-        ventana.grab_set()
-        ventana.focus_set()
-        
-        # Configurar cierre de ventana
-        ventana.protocol("WM_DELETE_WINDOW", cancelar)
-        
-        # Después de configurar todo, quitar topmost
-        ventana.after(100, lambda: ventana.attributes('-topmost', False))
-        
-        tk.Label(ventana, text=f"Se encontraron varios iconos compatibles con:\n'{nombre_iso}'\n\nElige el más apropiado:", 
-                 justify=tk.CENTER, wraplength=350).pack(pady=10)
+        Quien la muestra debe retener la imagen: al salir de la caché Tk la borra."""
+        try:
+            clave = (ruta, os.stat(ruta).st_mtime_ns, tamano)
+        except OSError:
+            return
+        if clave in self._cache:
+            self._cache.move_to_end(clave)
+            al_cargar(self._cache[clave])
+            return
+        if clave in self._pedidos:
+            self._pedidos[clave].append(al_cargar)
+            return
+        self._pedidos[clave] = [al_cargar]
+        self._hilos.submit(self._leer, clave)
+        if not self._sondeando:
+            self._sondeando = True
+            self.raiz.after(20, self._entregar)
 
-        # Frame para los botones
-        frame_botones = tk.Frame(ventana)
-        frame_botones.pack(pady=10, fill=tk.BOTH, expand=True)
-        
-        # Scrollbar si hay muchas opciones
-        if len(opciones) > 8:
-            canvas = tk.Canvas(frame_botones)
-            scrollbar = tk.Scrollbar(frame_botones, orient="vertical", command=canvas.yview)
-            scrollable_frame = tk.Frame(canvas)
-            
-            scrollable_frame.bind(
-                "<Configure>",
-                lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-            )
-            
-            canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-            canvas.configure(yscrollcommand=scrollbar.set)
-            
-            for opcion in opciones:
-                tk.Button(scrollable_frame, text=opcion, width=30, 
-                         command=lambda o=opcion: seleccionar(o)).pack(pady=2)
-            
-            canvas.pack(side="left", fill="both", expand=True)
-            scrollbar.pack(side="right", fill="y")
+    def _leer(self, clave):
+        """Hilo lector: la E/S del USB (lo lento) fuera del hilo de la interfaz"""
+        try:
+            with open(clave[0], "rb") as f:
+                datos = f.read()
+            self._listos.put((clave, base64.b64encode(datos), medidas_png(clave[0])))
+        except OSError:
+            self._listos.put((clave, None, None))
+
+    def _entregar(self):
+        """Decodifica en el hilo de Tk (PhotoImage no admite otros hilos) lo ya leído"""
+        import queue
+        while True:
+            try:
+                clave, datos, medidas = self._listos.get_nowait()
+            except queue.Empty:
+                break
+            imagen = None
+            if datos:
+                try:
+                    imagen = tk.PhotoImage(data=datos)
+                    lado = max(medidas or (imagen.width(), imagen.height()))
+                    factor = -(-lado // clave[2])
+                    if factor > 1:
+                        imagen = imagen.subsample(factor)
+                except tk.TclError:
+                    imagen = None
+            self._cache[clave] = imagen
+            while len(self._cache) > self.capacidad:
+                self._cache.popitem(last=False)
+            for al_cargar in self._pedidos.pop(clave, ()):
+                try:
+                    al_cargar(imagen)
+                except tk.TclError:
+                    pass  # La ventana se cerró mientras se leía
+        if self._pedidos:
+            self.raiz.after(30, self._entregar)
         else:
-            for opcion in opciones:
-                tk.Button(frame_botones, text=opcion, width=30, 
-                         command=lambda o=opcion: seleccionar(o)).pack(pady=2)
+            self._sondeando = False
 
-        # Botón cancelar
-        tk.Button(ventana, text="Cancelar (usar unknown)", width=20, 
-                 command=cancelar).pack(pady=10)
+class VentoyConfigGUI(VentoyConfig):
+    TAMANO_MINIATURA = 32
 
-        print("    - Esperando respuesta del usuario...")
-        # Esperar a que se cierre la ventana
-        ventana.wait_window()
-        print(f"    - Usuario respondió: {resultado[0]}")
-        return resultado[0]
+    def __init__(self):
+        super().__init__()
+        self._root = None  # La ventana raíz se crea con el primer diálogo
+        self._miniaturas = None
 
-    def gestionar_icono_faltante(self, tema, nombre_iso, clase_detectada=None):
-        """Maneja cuando no se encuentra un icono apropiado"""
-        print(f"    - Mostrando ventana de gestión de icono faltante...")
-        
-        # Asegurar que la ventana root esté visible
-        self.root.deiconify()
-        self.root.update()
-        
-        mensaje = f"No se encontró icono apropiado para '{nombre_iso}'"
-        if clase_detectada:
-            mensaje += f"\n(Detectado como: {clase_detectada})"
-        mensaje += "\n\n¿Qué deseas hacer?"
-        
-        resultado = [None]  # Usar lista para poder modificar desde funciones internas
-        
-        def seleccionar_manual():
-            print("    - Usuario seleccionó: manual")
-            resultado[0] = "manual"
-            ventana.destroy()
-        
-        def usar_unknown():
-            print("    - Usuario seleccionó: unknown")
-            resultado[0] = "unknown"
-            ventana.destroy()
-        
-        ventana = tk.Toplevel(self.root)
-        ventana.title("Icono no encontrado")
-        ventana.geometry("400x200")
-        ventana.resizable(False, False)
-        
-        # Forzar que aparezca la ventana
-        ventana.lift()
-        ventana.attributes('-topmost', True)
-        
-        # Centrar ventana
-        ventana.update_idletasks()
-        x = (ventana.winfo_screenwidth() // 2) - (400 // 2)
-        y = (ventana.winfo_screenheight() // 2) - (200 // 2)
-        ventana.geometry(f"400x200+{x}+{y}")
-        
-        ventana.transient(self.root)
-        ventana.grab_set()
-        ventana.focus_set()
-        ventana.protocol("WM_DELETE_WINDOW", usar_unknown)
-        
-        # Después de configurar todo, quitar topmost
-        ventana.after(100, lambda: ventana.attributes('-topmost', False))
-        
-        tk.Label(ventana, text=mensaje, justify=tk.CENTER, wraplength=350).pack(pady=20)
-        
-        frame_botones = tk.Frame(ventana)
-        frame_botones.pack(pady=10)
-        
-        tk.Button(frame_botones, text="Seleccionar icono manualmente", 
-                 command=seleccionar_manual).pack(pady=5)
-        tk.Button(frame_botones, text="Usar icono 'unknown'", 
-                 command=usar_unknown).pack(pady=5)
-        
-        print("    - Esperando respuesta del usuario...")
-        ventana.wait_window()
-        print(f"    - Usuario respondió: {resultado[0]}")
-        
-        if resultado[0] == "manual":
-            if self.copiar_icono_manual(tema, nombre_iso):
-                return nombre_iso
-            else:
-                messagebox.showinfo("Aviso", "No se seleccionó ningún icono. Se usará 'unknown'.")
-        
-        # Verificar si existe unknown.png
-        ruta_unknown = os.path.join("Themes", tema, "icons", "unknown.png")
-        if os.path.isfile(ruta_unknown):
-            return "unknown"
+    def _iniciar_interfaz(self):
+        """Carga tkinter y crea la ventana raíz oculta; False si no hay pantalla"""
+        if self._root is None:
+            try:
+                importar_tkinter()
+                self._root = tk.Tk()
+            except Exception:  # tkinter no instalado o TclError sin pantalla
+                return False
+            self._root.withdraw()  # Ocultar ventana principal
+        return True
+
+    @property
+    def root(self):
+        if not self._iniciar_interfaz():
+            raise RuntimeError("No hay interfaz gráfica disponible (prueba con --batch)")
+        return self._root
+
+    def mostrar_info(self, titulo, mensaje):
+        if self._iniciar_interfaz():
+            messagebox.showinfo(titulo, mensaje)
         else:
-            messagebox.showwarning("Falta unknown.png", 
-                                 "No se encontró 'unknown.png'. Considera agregarlo al tema.")
-            return ""
+            super().mostrar_info(titulo, mensaje)
+
+    def mostrar_aviso(self, titulo, mensaje):
+        if self._iniciar_interfaz():
+            messagebox.showwarning(titulo, mensaje)
+        else:
+            super().mostrar_aviso(titulo, mensaje)
+
+    def mostrar_error(self, titulo, mensaje):
+        if self._iniciar_interfaz():
+            messagebox.showerror(titulo, mensaje)
+        else:
+            super().mostrar_error(titulo, mensaje)
+
+    @property
+    def miniaturas(self):
+        if self._miniaturas is None:
+            self._miniaturas = CargadorMiniaturas(self.root)
+        return self._miniaturas
+
+    def preguntar_si(self, titulo, mensaje):
+        """Pregunta de sí/no al usuario"""
+        self.root  # Crea la ventana raíz si aún no existe
+        return messagebox.askyesno(titulo, mensaje)
 
     def copiar_icono_manual(self, tema, nombre_clase):
         """Copia un icono seleccionado manualmente"""
@@ -295,7 +3023,11 @@ class VentoyConfigGUI:
         )
         if origen:
             try:
+                import shutil
                 shutil.copy(origen, ruta_destino)
+                indice = self._indices_iconos.get(tema)
+                if indice is not None:
+                    indice.agregar(nombre_clase)
                 messagebox.showinfo("Éxito", f"Icono copiado como '{nombre_clase}.png'")
                 return True
             except Exception as e:
@@ -303,96 +3035,302 @@ class VentoyConfigGUI:
                 return False
         return False
 
-    def preguntar_sistema_operativo(self, nombre_iso, base):
-        """Pregunta al usuario qué sistema operativo es"""
-        print(f"    - Mostrando ventana de selección de sistema operativo...")
-        
-        # Asegurar que la ventana root esté visible
-        self.root.deiconify()
-        self.root.update()
-        
-        sistemas_comunes = [
-            "ubuntu", "debian", "fedora", "archlinux", "windows", 
-            "linuxmint", "manjaro", "opensuse", "centos", "unknown"
-        ]
-        
-        resultado = [None]  # Usar lista para poder modificar desde funciones internas
-        
-        def seleccionar_sistema(sistema):
-            print(f"    - Usuario seleccionó sistema: {sistema}")
-            resultado[0] = sistema
-            ventana.destroy()
-        
-        def entrada_personalizada():
-            print("    - Usuario eligió entrada personalizada")
-            ventana.withdraw()  # Ocultar ventana temporalmente
-            custom = simpledialog.askstring(
-                "Sistema personalizado",
-                f"¿Qué sistema operativo es '{nombre_iso}'?\n(Será agregado a la base de datos)",
-                parent=self.root
-            )
-            if custom:
-                resultado[0] = custom.lower()
-                print(f"    - Usuario escribió: {resultado[0]}")
-            else:
-                resultado[0] = "unknown"
-                print("    - Usuario canceló entrada personalizada")
-            ventana.destroy()
-        
+    def _crear_ventana_revision(self):
+        """Crea la ventana de revisión una sola vez; las siguientes revisiones la reutilizan"""
         ventana = tk.Toplevel(self.root)
-        ventana.title("Sistema no reconocido")
-        ventana.geometry("400x300")
-        ventana.resizable(False, False)
-        
-        # Forzar que aparezca la ventana
-        ventana.lift()
-        ventana.attributes('-topmost', True)
+        ventana.title("Revisar ISOs")
+        ventana.geometry("900x500")
         
         # Centrar ventana
         ventana.update_idletasks()
-        x = (ventana.winfo_screenwidth() // 2) - (400 // 2)
-        y = (ventana.winfo_screenheight() // 2) - (300 // 2)
-        ventana.geometry(f"400x300+{x}+{y}")
-        
+        x = (ventana.winfo_screenwidth() // 2) - (900 // 2)
+        y = (ventana.winfo_screenheight() // 2) - (500 // 2)
+        ventana.geometry(f"900x500+{x}+{y}")
         ventana.transient(self.root)
-        ventana.grab_set()
-        ventana.focus_set()
-        ventana.protocol("WM_DELETE_WINDOW", lambda: seleccionar_sistema("unknown"))
-        
-        # Después de configurar todo, quitar topmost
-        ventana.after(100, lambda: ventana.attributes('-topmost', False))
         
-        tk.Label(ventana, text=f"No se pudo detectar automáticamente:\n'{nombre_iso}'\n\nSelecciona el sistema operativo:", 
-                 justify=tk.CENTER, wraplength=350).pack(pady=10)
+        etiqueta = tk.Label(ventana, justify=tk.CENTER)
+        etiqueta.pack(pady=10)
+        
+        frame_tabla = tk.Frame(ventana)
+        frame_tabla.pack(padx=10, fill=tk.BOTH, expand=True)
+        
+        columnas = ("iso", "estado", "sistema", "candidatos", "icono")
+        # Filas altas para la miniatura del icono en la columna del árbol
+        ttk.Style(ventana).configure("Revision.Treeview", rowheight=self.TAMANO_MINIATURA + 4)
+        tabla = ttk.Treeview(frame_tabla, columns=columnas, show="tree headings", style="Revision.Treeview")
+        tabla.column("#0", width=self.TAMANO_MINIATURA + 16, stretch=False)
+        for columna, titulo, ancho in (("iso", "ISO", 260), ("estado", "Estado", 90),
+                                       ("sistema", "Sistema", 110), ("candidatos", "Iconos compatibles", 240),
+                                       ("icono", "Icono", 150)):
+            tabla.heading(columna, text=titulo)
+            tabla.column(columna, width=ancho)
+        tabla.tag_configure("pendiente", background="#fff3c4")
+        scrollbar = tk.Scrollbar(frame_tabla, orient="vertical", command=tabla.yview)
+        
+        def al_desplazar(*args):
+            scrollbar.set(*args)
+            self._revision_miniaturas_visibles()
+        
+        tabla.configure(yscrollcommand=al_desplazar)
+        tabla.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
         
-        frame_sistemas = tk.Frame(ventana)
-        frame_sistemas.pack(pady=10, fill=tk.BOTH, expand=True)
+        # Iconos compatibles de la fila seleccionada, con miniatura; un clic los asigna
+        frame_candidatos = tk.LabelFrame(ventana, text="Iconos compatibles de la ISO seleccionada")
+        frame_candidatos.pack(padx=10, pady=(8, 0), fill=tk.X)
+        lienzo = tk.Canvas(frame_candidatos, height=self.TAMANO_MINIATURA * 2 + 24, highlightthickness=0)
+        barra_candidatos = tk.Scrollbar(frame_candidatos, orient="horizontal", command=lienzo.xview)
+        fila_candidatos = tk.Frame(lienzo)
+        fila_candidatos.bind("<Configure>", lambda e: lienzo.configure(scrollregion=lienzo.bbox("all")))
+        lienzo.create_window((0, 0), window=fila_candidatos, anchor="nw")
+        lienzo.configure(xscrollcommand=barra_candidatos.set)
+        lienzo.pack(fill=tk.X)
+        barra_candidatos.pack(fill=tk.X)
+        
+        # Un único combobox que se coloca sobre la celda que se edita
+        editor = ttk.Combobox(tabla)
+        terminado = tk.BooleanVar(ventana, False)
         
-        # Crear botones en columnas
-        for i, sistema in enumerate(sistemas_comunes):
-            row = i // 2
-            col = i % 2
-            tk.Button(frame_sistemas, text=sistema.title(), width=15,
-                     command=lambda s=sistema: seleccionar_sistema(s)).grid(row=row, column=col, padx=5, pady=2)
+        frame_botones = tk.Frame(ventana)
+        frame_botones.pack(pady=10)
+        tk.Button(frame_botones, text="Copiar icono manualmente...", 
+                 command=self._revision_icono_manual).pack(side="left", padx=5)
+        tk.Button(frame_botones, text="Aceptar y guardar", width=18, 
+                 command=self._revision_aceptar).pack(side="left", padx=5)
+        
+        tabla.bind("<Double-1>", self._revision_editar)
+        tabla.bind("<<TreeviewSelect>>", self._revision_mostrar_candidatos)
+        tabla.bind("<Button-1>", self._revision_confirmar_edicion)  # Clic fuera del editor
+        editor.bind("<<ComboboxSelected>>", self._revision_confirmar_edicion)
+        editor.bind("<Return>", self._revision_confirmar_edicion)
+        editor.bind("<Escape>", lambda e: (self._revision["edicion"].clear(), editor.place_forget()))
+        ventana.protocol("WM_DELETE_WINDOW", self._revision_aceptar)
+        ventana.withdraw()
+        
+        self._revision = {"ventana": ventana, "etiqueta": etiqueta, "tabla": tabla,
+                          "editor": editor, "terminado": terminado, "edicion": {},
+                          "candidatos": fila_candidatos, "miniaturas": {}, "imagenes": {}}
+        return self._revision
+
+    def revisar_resoluciones(self, resoluciones, tema, base, preguntar_sistema=True):
+        """Tabla única para revisar y corregir todas las ISOs antes de guardar"""
+        if not resoluciones:
+            return
+        pendientes = [r for r in resoluciones if r.pendiente]
+        print(f"    - Mostrando tabla de revisión ({len(resoluciones)} ISOs, {len(pendientes)} pendientes)...")
+        
+        revision = getattr(self, "_revision", None) or self._crear_ventana_revision()
+        ventana, tabla = revision["ventana"], revision["tabla"]
+        indice = self.obtener_indice_iconos(tema)
+        revision.update(tema=tema, base=base, preguntar_sistema=preguntar_sistema, filas={}, confirmadas=set(),
+                        iconos_tema=list(indice.iconos) if indice else [])
+        revision["miniaturas"].clear()
+        revision["imagenes"].clear()
+        
+        # Reutilizar la tabla: vaciar filas de la revisión anterior y cargar las nuevas
+        tabla.delete(*tabla.get_children())
+        for boton in revision["candidatos"].winfo_children():
+            boton.destroy()
+        for resolucion in pendientes + [r for r in resoluciones if not r.pendiente]:
+            if resolucion.pendiente:
+                estado, icono = "pendiente", ""  # Sin icono hasta que el usuario lo elija
+            else:
+                estado = ("sin cambios" if resolucion.reutilizada else
+                          "renombrada" if resolucion.heredada else "automático")
+                icono = resolucion.clase
+            item = tabla.insert("", tk.END, values=(resolucion.nombre, estado, resolucion.sistema or "unknown",
+                                                     self._texto_candidatos(resolucion.candidatos), icono),
+                                tags=("pendiente",) if resolucion.pendiente else ())
+            revision["filas"][item] = resolucion
+        
+        revision["etiqueta"].configure(
+            text=f"{len(resoluciones)} ISOs, {len(pendientes)} pendientes de revisión (resaltadas).\n"
+                 "Doble clic en Sistema o Icono para cambiarlo. Ventoy.Json se guarda al aceptar;\n"
+                 "las pendientes a las que no se les elija icono no se guardan.")
+        
+        # Asegurar que las ventanas estén visibles
+        self.root.deiconify()
+        ventana.deiconify()
+        ventana.lift()
+        ventana.grab_set()
+        ventana.focus_set()
         
-        tk.Button(ventana, text="Otro (personalizado)", 
-                 command=entrada_personalizada).pack(pady=5)
-        tk.Button(ventana, text="Saltar (usar unknown)", 
-                 command=lambda: seleccionar_sistema("unknown")).pack(pady=5)
+        # Miniaturas solo de las filas visibles; el resto al desplazarse
+        ventana.after_idle(self._revision_miniaturas_visibles)
         
         print("    - Esperando respuesta del usuario...")
-        ventana.wait_window()
-        print(f"    - Usuario respondió: {resultado[0]}")
+        revision["terminado"].set(False)
+        ventana.wait_variable(revision["terminado"])
+        ventana.grab_release()
+        ventana.withdraw()
         
-        if resultado[0] and resultado[0] != "unknown":
-            # Agregar a la base de datos
-            clave = re.sub(r"[^a-z0-9]", "", nombre_iso.lower())
-            base[clave] = [resultado[0]]
-            self.guardar_base_datos(base)
-            messagebox.showinfo("Base actualizada", f"Se agregó '{nombre_iso}' -> '{resultado[0]}' a la base de datos")
-            return clave, resultado[0]
-        
-        return None, "unknown"
+        if any(r.clase in ("", "unknown") for r in resoluciones) and not self.icono_unknown(tema):
+            messagebox.showwarning("Falta unknown.png", 
+                                 "No se encontró 'unknown.png'. Considera agregarlo al tema.")
+
+    @staticmethod
+    def _texto_candidatos(candidatos):
+        """Resumen de los iconos compatibles para la columna de la tabla"""
+        texto = ", ".join(candidatos[:4])
+        return texto + f" (+{len(candidatos) - 4})" if len(candidatos) > 4 else texto
+
+    def _revision_editar(self, evento):
+        """Abre el editor sobre la celda de Sistema o Icono"""
+        revision = self._revision
+        tabla, editor = revision["tabla"], revision["editor"]
+        item = tabla.identify_row(evento.y)
+        columna = {"#3": "sistema", "#5": "icono"}.get(tabla.identify_column(evento.x))
+        if not item or not columna:
+            return
+        resolucion = revision["filas"][item]
+        if columna == "sistema":
+            if resolucion.clave or not revision["preguntar_sistema"]:
+                return  # Sistema ya detectado
+            valores = self.SISTEMAS_COMUNES
+        else:
+            valores = resolucion.candidatos + [i for i in revision["iconos_tema"] if i not in resolucion.candidatos]
+        x, y, ancho, alto = tabla.bbox(item, columna)
+        revision["edicion"].update(item=item, columna=columna)
+        editor.configure(values=valores)
+        editor.set(tabla.set(item, columna))
+        editor.place(x=x, y=y, width=ancho, height=alto)
+        editor.focus_set()
+
+    def _revision_confirmar_edicion(self, evento=None):
+        """Aplica el valor del editor a la celda que se estaba editando"""
+        revision = self._revision
+        tabla, editor, edicion = revision["tabla"], revision["editor"], revision["edicion"]
+        if "item" not in edicion:
+            return
+        item, columna = edicion.pop("item"), edicion.pop("columna")
+        valor = editor.get().strip()
+        editor.place_forget()
+        if columna == "sistema":
+            valor = valor.lower() or "unknown"
+            tabla.set(item, "sistema", valor)
+            # Recalcular iconos compatibles con el sistema elegido
+            resolucion = revision["filas"][item]
+            equivalentes = [valor] if valor != "unknown" else []
+            resolucion.candidatos = self.candidatos_icono(revision["tema"], resolucion.nombre, equivalentes)
+            tabla.set(item, "candidatos", self._texto_candidatos(resolucion.candidatos))
+            self._revision_fijar_icono(item, resolucion.candidatos[0] if resolucion.candidatos
+                                       else self.icono_unknown(revision["tema"]))
+            self._revision_mostrar_candidatos()
+        else:
+            self._revision_fijar_icono(item, valor or self.icono_unknown(revision["tema"]))
+
+    def _revision_icono_manual(self):
+        """Copia un icono elegido por el usuario para la ISO seleccionada"""
+        revision = self._revision
+        tabla = revision["tabla"]
+        seleccion = tabla.selection()
+        if not seleccion:
+            messagebox.showinfo("Icono manual", "Selecciona primero una ISO de la lista.", parent=revision["ventana"])
+            return
+        resolucion = revision["filas"][seleccion[0]]
+        if self.copiar_icono_manual(revision["tema"], resolucion.nombre):
+            revision["iconos_tema"].append(resolucion.nombre)
+            self._revision_fijar_icono(seleccion[0], resolucion.nombre)
+
+    def _ruta_icono(self, tema, icono):
+        return os.path.join("Themes", tema, "icons", f"{icono}.png")
+
+    def _revision_fijar_icono(self, item, icono):
+        """Cambia el icono de una fila y su miniatura; una fila pendiente queda revisada"""
+        revision = self._revision
+        revision["tabla"].set(item, "icono", icono)
+        if revision["filas"][item].pendiente and item not in revision["confirmadas"]:
+            revision["confirmadas"].add(item)
+            revision["tabla"].set(item, "estado", "revisada")
+            revision["tabla"].item(item, tags=())
+        revision["miniaturas"].pop(item, None)
+        self._revision_miniaturas_visibles()
+
+    def _revision_miniaturas_visibles(self):
+        """Pide las miniaturas de las filas que se ven ahora en la tabla"""
+        revision = getattr(self, "_revision", None)
+        if not revision or "tema" not in revision:
+            return
+        tabla, pedidas, imagenes = revision["tabla"], revision["miniaturas"], revision["imagenes"]
+        filas = tabla.get_children()
+        if not filas:
+            return
+        item = filas[min(len(filas) - 1, int(tabla.yview()[0] * len(filas)))]
+        visibles = set()
+        while item and tabla.bbox(item):
+            visibles.add(item)
+            icono = tabla.set(item, "icono")
+            if pedidas.get(item) != icono:
+                pedidas[item] = icono
+                imagenes.pop(item, None)
+                tabla.item(item, image="")
+                self.miniaturas.pedir(self._ruta_icono(revision["tema"], icono), self.TAMANO_MINIATURA,
+                                      lambda imagen, item=item, icono=icono:
+                                      self._revision_poner_miniatura(item, icono, imagen))
+            item = tabla.next(item)
+        # Las filas que salen de la vista sueltan su imagen (la caché puede descartarla) y se
+        # vuelven a pedir al reaparecer
+        for item in [i for i in pedidas if i not in visibles]:
+            del pedidas[item]
+            imagenes.pop(item, None)
+            tabla.item(item, image="")
+
+    def _revision_poner_miniatura(self, item, icono, imagen):
+        """Muestra la miniatura en su fila y la retiene mientras la fila esté a la vista"""
+        revision = self._revision
+        if revision["miniaturas"].get(item) != icono:
+            return  # La fila salió de la vista o cambió de icono mientras se leía
+        revision["imagenes"][item] = imagen
+        revision["tabla"].item(item, image=imagen or "")
+
+    def _revision_mostrar_candidatos(self, evento=None):
+        """Botones con miniatura para los iconos compatibles de la fila seleccionada"""
+        revision = self._revision
+        tabla, fila = revision["tabla"], revision["candidatos"]
+        for boton in fila.winfo_children():
+            boton.destroy()
+        seleccion = tabla.selection()
+        if not seleccion:
+            return
+        item = seleccion[0]
+        for icono in revision["filas"][item].candidatos[:40]:
+            boton = tk.Button(fila, text=icono, compound="top", wraplength=self.TAMANO_MINIATURA * 3,
+                              command=lambda i=icono: self._revision_fijar_icono(item, i))
+            boton.pack(side="left", padx=2, pady=2)
+
+            def mostrar(imagen, boton=boton):
+                boton.imagen = imagen  # La caché LRU puede descartarla; el botón la retiene
+                boton.configure(image=imagen or "")
+
+            self.miniaturas.pedir(self._ruta_icono(revision["tema"], icono), self.TAMANO_MINIATURA, mostrar)
+
+    def _revision_aceptar(self):
+        """Vuelca los valores de la tabla a las resoluciones y cierra la revisión"""
+        revision = self._revision
+        tabla, base = revision["tabla"], revision["base"]
+        self._revision_confirmar_edicion()
+        sin_revisar = {item for item, resolucion in revision["filas"].items()
+                       if resolucion.pendiente and item not in revision["confirmadas"]}
+        if sin_revisar and not messagebox.askyesno(
+                "ISOs sin revisar",
+                f"Quedan {len(sin_revisar)} ISOs pendientes sin icono elegido.\n"
+                "No se guardarán en Ventoy.Json y se volverán a mostrar en el próximo escaneo.\n\n"
+                "¿Guardar el resto?", parent=revision["ventana"]):
+            return
+        for item, resolucion in revision["filas"].items():
+            if item in sin_revisar:
+                continue  # Sigue pendiente: sin clase ni entrada en el estado
+            sistema = tabla.set(item, "sistema")
+            if revision["preguntar_sistema"] and not resolucion.clave and sistema != "unknown":
+                resolucion.clave = self.registrar_sistema(resolucion.nombre, sistema, base)
+                resolucion.sistema = sistema
+                print(f"    - Base actualizada: '{resolucion.nombre}' -> '{sistema}'")
+            icono = tabla.set(item, "icono")
+            if icono != resolucion.clase:
+                # Corregida por el usuario: hay que volver a guardarla en el estado
+                resolucion.clase = icono
+                resolucion.reutilizada = False
+        revision["terminado"].set(True)
 
     def seleccionar_tema(self, temas_disponibles, tema_actual):
         """Ventana para seleccionar un tema"""
@@ -454,13 +3392,31 @@ class VentoyConfigGUI:
         )
         
         canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        
+        # Vista previa del fondo de cada tema, cargada al aparecer en pantalla
+        botones = []
+        
+        def cargar_visibles(*args):
+            if args:
+                scrollbar.set(*args)
+            arriba, abajo = canvas.canvasy(0), canvas.canvasy(canvas.winfo_height())
+            for boton, ruta in list(botones):
+                if ruta and boton.winfo_y() <= abajo and boton.winfo_y() + boton.winfo_height() >= arriba:
+                    botones.remove((boton, ruta))
+                    self.miniaturas.pedir(ruta, 64, lambda imagen, b=boton: b.configure(image=imagen or ""))
+        
+        canvas.configure(yscrollcommand=cargar_visibles)
         
         for tema in temas_disponibles:
-            color = "lightblue" if tema == tema_actual else "white"
-            text = f"{tema} (actual)" if tema == tema_actual else tema
-            tk.Button(scrollable_frame, text=text, width=30, bg=color,
-                     command=lambda t=tema: seleccionar(t)).pack(pady=2)
+            info = self.info_tema(tema)
+            color = "lightblue" if tema == tema_actual else "#ffd6d6" if info and info["problemas"] else "white"
+            text = self.describir_tema(tema) + (" (actual)" if tema == tema_actual else "")
+            boton = tk.Button(scrollable_frame, text=text, bg=color, compound="left", anchor="w",
+                              command=lambda t=tema: seleccionar(t))
+            boton.pack(pady=2, fill=tk.X)
+            fondo = info.get("fondo") if info else None
+            botones.append((boton, os.path.join("Themes", tema, fondo) if fondo else None))
+        ventana.after_idle(cargar_visibles)
         
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -473,16 +3429,6 @@ class VentoyConfigGUI:
         print(f"    - Usuario respondió: {resultado[0]}")
         return resultado[0]
 
-    def cambiar_tema(self, config, nuevo_tema, ruta_json):
-        """Cambia el tema en la configuración"""
-        config["theme"]["file"] = f"/Ventoy/Themes/{nuevo_tema}/theme.txt"
-        
-        with open(ruta_json, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4)
-        
-        print(f"Tema cambiado a: {nuevo_tema}")
-        return True
-
     def mostrar_menu_principal(self, isos_info, temas_disponibles, tema_actual):
         """Muestra el menú principal con opciones"""
         print(f"    - Mostrando menú principal...")
@@ -571,102 +3517,6 @@ class VentoyConfigGUI:
         print(f"    - Usuario respondió: {resultado[0]}")
         return resultado[0]
 
-    def actualizar_json(self, config, nuevas_isos, tema, base, ruta_json):
-        """Actualiza el JSON con las nuevas ISOs detectadas"""
-        existentes = {c["key"]: c["class"] for c in config.get("menu_class", [])}
-        parent_dir = os.path.dirname(os.getcwd())
-        isos_actuales = [os.path.splitext(f)[0] for f in os.listdir(parent_dir) if f.lower().endswith(".iso")]
-        
-        print(f"Procesando {len(nuevas_isos)} nuevas ISOs...")
-        
-        for iso_archivo in nuevas_isos:
-            nombre_iso = os.path.splitext(iso_archivo)[0]
-            print(f"Procesando: {nombre_iso}")
-            
-            # 1. Detectar sistema automáticamente
-            clave_detectada, sistema_detectado = self.detectar_sistema_automatico(nombre_iso, base)
-            
-            if clave_detectada:
-                print(f"  - Detectado automáticamente: {sistema_detectado}")
-                equivalentes = base[clave_detectada]
-            else:
-                print(f"  - No detectado automáticamente, preguntando al usuario...")
-                clave_detectada, sistema_detectado = self.preguntar_sistema_operativo(nombre_iso, base)
-                equivalentes = [sistema_detectado] if sistema_detectado != "unknown" else []
-            
-            # 2. Buscar icono apropiado
-            icono_usado = self.buscar_icono_por_partes(tema, nombre_iso, equivalentes)
-            
-            if not icono_usado:
-                print(f"  - No se encontró icono, gestionando...")
-                icono_usado = self.gestionar_icono_faltante(tema, nombre_iso, sistema_detectado)
-            
-            if not icono_usado:
-                icono_usado = "unknown"
-            
-            print(f"  - Icono asignado: {icono_usado}")
-            existentes[nombre_iso] = icono_usado
-        
-        # Limpiar entradas que ya no existen
-        for key in list(existentes.keys()):
-            if key not in isos_actuales:
-                del existentes[key]
-        
-        # Actualizar configuración
-        config["menu_class"] = [{"key": k, "class": v} for k, v in sorted(existentes.items())]
-        
-        with open(ruta_json, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4)
-        
-        messagebox.showinfo("Éxito", f"Ventoy.Json actualizado correctamente.\nProcesadas {len(nuevas_isos)} ISOs nuevas.")
-
-    def rescanear_iconos_tema(self, config, tema, base, ruta_json):
-        """Rescanea todos los iconos para el nuevo tema"""
-        print(f"Rescaneando iconos para tema: {tema}")
-        
-        # Obtener todas las ISOs existentes
-        parent_dir = os.path.dirname(os.getcwd())
-        isos_existentes = [os.path.splitext(f)[0] for f in os.listdir(parent_dir) if f.lower().endswith(".iso")]
-        
-        # Actualizar iconos para todas las ISOs
-        nuevos_iconos = {}
-        
-        for nombre_iso in isos_existentes:
-            print(f"Rescaneando: {nombre_iso}")
-            
-            # Detectar sistema (usar lo que ya está en la base o detectar)
-            clave_detectada, sistema_detectado = self.detectar_sistema_automatico(nombre_iso, base)
-            
-            if clave_detectada:
-                equivalentes = base[clave_detectada]
-            else:
-                # Buscar en configuración actual
-                iso_config = next((item for item in config.get("menu_class", []) if item["key"] == nombre_iso), None)
-                if iso_config:
-                    equivalentes = [iso_config["class"]]
-                else:
-                    equivalentes = []
-            
-            # Buscar icono apropiado para el nuevo tema
-            icono_usado = self.buscar_icono_por_partes(tema, nombre_iso, equivalentes)
-            
-            if not icono_usado:
-                icono_usado = self.gestionar_icono_faltante(tema, nombre_iso, sistema_detectado)
-            
-            if not icono_usado:
-                icono_usado = "unknown"
-            
-            print(f"  - Icono asignado: {icono_usado}")
-            nuevos_iconos[nombre_iso] = icono_usado
-        
-        # Actualizar configuración
-        config["menu_class"] = [{"key": k, "class": v} for k, v in sorted(nuevos_iconos.items())]
-        
-        with open(ruta_json, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4)
-        
-        messagebox.showinfo("Éxito", f"Iconos rescaneados para tema '{tema}'.\nActualizadas {len(nuevos_iconos)} ISOs.")
-
     def run(self):
         """Función principal"""
         print("Iniciando Ventoy Config GUI...")
@@ -681,28 +3531,21 @@ class VentoyConfigGUI:
             # Detectar tema actual
             tema_actual = self.obtener_tema(config)
             if not tema_actual:
-                messagebox.showerror("Error", "No se pudo detectar el tema actual")
+                self.mostrar_error("Error", "No se pudo detectar el tema actual")
                 return
 
             # Listar temas disponibles
             temas_disponibles = self.listar_temas_disponibles()
             if not temas_disponibles:
-                messagebox.showerror("Error", "No se encontraron temas disponibles")
+                self.mostrar_error("Error", "No se encontraron temas disponibles")
                 return
 
             print(f"Tema actual: {tema_actual}")
             print(f"Temas disponibles: {temas_disponibles}")
             
             # Verificar ISOs
-            clases_actuales = [item["key"] for item in config.get("menu_class", [])]
-            isos_en_raiz = self.listar_isos()
-            nuevas_isos = [f for f in isos_en_raiz if os.path.splitext(f)[0] not in clases_actuales]
-
-            isos_info = {
-                'total': len(isos_en_raiz),
-                'nuevas': len(nuevas_isos),
-                'lista_nuevas': nuevas_isos
-            }
+            isos_info = self.resumen_usb(config)
+            nuevas_isos = isos_info['lista_nuevas']
 
             print(f"ISOs totales: {isos_info['total']}")
             print(f"ISOs nuevas: {isos_info['nuevas']}")
@@ -713,44 +3556,155 @@ class VentoyConfigGUI:
             if accion == "agregar_isos":
                 if nuevas_isos:
                     # Mostrar resumen y confirmar
-                    if messagebox.askyesno("Confirmar procesamiento", 
+                    if self.preguntar_si("Confirmar procesamiento", 
                                           f"Se encontraron {len(nuevas_isos)} ISOs nuevas:\n\n" + 
                                           "\n".join(f"• {iso}" for iso in nuevas_isos[:10]) + 
                                           (f"\n... y {len(nuevas_isos)-10} más" if len(nuevas_isos) > 10 else "") +
                                           "\n\n¿Proceder con la configuración?"):
                         self.actualizar_json(config, nuevas_isos, tema_actual, base, ruta_json)
                 else:
-                    messagebox.showinfo("Sin cambios", "No hay nuevas ISOs para agregar.")
+                    self.mostrar_info("Sin cambios", "No hay nuevas ISOs para agregar.")
             
             elif accion == "cambiar_tema":
                 nuevo_tema = self.seleccionar_tema(temas_disponibles, tema_actual)
+                problemas = self.problemas_tema(nuevo_tema, config)[0] if nuevo_tema else []
+                if problemas and not self.preguntar_si(
+                        "Tema con errores", f"El tema '{nuevo_tema}' tiene errores:\n\n" +
+                        "\n".join(f"• {p}" for p in problemas) + "\n\n¿Aplicarlo de todos modos?"):
+                    nuevo_tema = None
                 if nuevo_tema and nuevo_tema != tema_actual:
-                    # Cambiar tema
-                    if self.cambiar_tema(config, nuevo_tema, ruta_json):
-                        messagebox.showinfo("Tema cambiado", f"Tema cambiado a: {nuevo_tema}")
-                        
-                        # Preguntar si quiere rescanear iconos
-                        if messagebox.askyesno("Rescanear iconos", 
-                                              f"¿Deseas rescanear los iconos para el nuevo tema '{nuevo_tema}'?\n\n" +
-                                              "Esto actualizará los iconos de todas las ISOs existentes."):
-                            # Recargar configuración con el nuevo tema
-                            config, _ = self.cargar_ventoy_json()
-                            self.rescanear_iconos_tema(config, nuevo_tema, base, ruta_json)
+                    # Preguntar antes si quiere rescanear iconos: tema e iconos se escriben juntos
+                    rescanear = self.preguntar_si("Rescanear iconos", 
+                                                  f"¿Deseas rescanear los iconos para el nuevo tema '{nuevo_tema}'?\n\n" +
+                                                  "Esto actualizará los iconos de todas las ISOs existentes.")
+                    if rescanear:
+                        # Como en --batch: tema en memoria y una sola escritura (o un solo plan)
+                        self.aplicar_tema(config, nuevo_tema)
+                        self.rescanear_iconos_tema(config, nuevo_tema, base, ruta_json)
+                    else:
+                        self.cambiar_tema(config, nuevo_tema, ruta_json)
+                    if not self.simular:
+                        self.mostrar_info("Tema cambiado", f"Tema cambiado a: {nuevo_tema}")
                 elif nuevo_tema == tema_actual:
-                    messagebox.showinfo("Sin cambios", "El tema seleccionado ya está activo.")
+                    self.mostrar_info("Sin cambios", "El tema seleccionado ya está activo.")
             
             elif accion == "salir":
                 print("Saliendo...")
             
         except Exception as e:
             print(f"Error: {e}")
-            messagebox.showerror("Error", f"Ocurrió un error: {e}")
+            self.mostrar_error("Error", f"Ocurrió un error: {e}")
         finally:
-            self.root.quit()
+            if self._root is not None:
+                self._root.quit()
+
+
+def guardar_plan(ruta, planes, simulado):
+    """Vuelca los planes calculados en JSON"""
+    datos = {"simulado": simulado, "planes": planes}
+    if ruta == "-":
+        print(json.dumps(datos, indent=2, ensure_ascii=False))
+    else:
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos, f, indent=2, ensure_ascii=False)
 
 def main():
-    app = VentoyConfigGUI()
-    app.run()
+    parser = argparse.ArgumentParser(description="Configura los iconos de Ventoy.Json según las ISOs del USB")
+    parser.add_argument("--batch", action="store_true",
+                        help="procesar las ISOs nuevas sin interfaz gráfica")
+    parser.add_argument("--estado", action="store_true",
+                        help="mostrar el tema y las ISOs nuevas sin modificar nada (sin interfaz)")
+    parser.add_argument("--validar", action="store_true",
+                        help="comprobar Ventoy.Json y los iconos del tema sin modificar nada (sin interfaz)")
+    parser.add_argument("--watch", "--vigilar", dest="vigilar", action="store_true",
+                        help="(sin interfaz) vigilar el USB y aplicar las ISOs que se copien o borren")
+    parser.add_argument("--provisionar", nargs="+", metavar="MONTAJE",
+                        help="(sin interfaz) aplicar esta configuración a los USB montados en estas rutas")
+    parser.add_argument("--copiar-tema", action="store_true",
+                        help="(con --provisionar) copiar también la carpeta del tema a cada USB")
+    parser.add_argument("--optimizar-iconos", action="store_true",
+                        help="(sin interfaz) reducir los iconos del tema al tamaño de theme.txt, "
+                             "quitar metadatos y duplicados, e informar del ahorro")
+    parser.add_argument("--quitar-sin-uso", action="store_true",
+                        help="(con --optimizar-iconos) apartar a icons_sin_usar los iconos que no usa menu_class")
+    parser.add_argument("--extensiones", default=",".join(EXTENSIONES_IMAGEN),
+                        help="extensiones de imagen a buscar, separadas por comas (por defecto: %(default)s)")
+    parser.add_argument("--excluir", action="append", default=[], metavar="PATRON",
+                        help="patrón glob de carpetas o archivos a ignorar (se puede repetir)")
+    parser.add_argument("--contenido", action="store_true",
+                        help="si el nombre no basta, detectar el sistema por la etiqueta de volumen de la ISO")
+    parser.add_argument("--sin-clasificador", action="store_true",
+                        help="no usar el clasificador aprendido: preguntar siempre si el nombre no coincide")
+    parser.add_argument("--identidad", action="store_true",
+                        help="reconocer ISOs renombradas o movidas por su contenido (tamaño y hash de los extremos)")
+    parser.add_argument("--tema", help="(con --batch) cambiar a este tema y rescanear los iconos")
+    parser.add_argument("--si-ambiguo", choices=["primero", "unknown", "fallar"], default="primero",
+                        help="(con --batch) qué hacer si hay varios iconos compatibles")
+    parser.add_argument("--simular", "--dry-run", dest="simular", action="store_true",
+                        help="mostrar los cambios que se harían en Ventoy.Json sin escribir nada")
+    parser.add_argument("--compactar", action="store_true",
+                        help="escribir menu_class como el mínimo de reglas por fragmento de nombre "
+                             "(comprobando que cada imagen conserva su clase)")
+    parser.add_argument("--plan", metavar="ARCHIVO",
+                        help="guardar en ARCHIVO (o '-' para la salida estándar) los cambios en JSON")
+    parser.add_argument("--traza", metavar="ARCHIVO",
+                        help="guardar en ARCHIVO (JSON-lines) los tiempos de cada etapa y las llamadas al disco")
+    parser.add_argument("--perfil", metavar="ARCHIVO",
+                        help="guardar un volcado de cProfile del hilo principal (ver con python -m pstats)")
+    parser.add_argument("--si-falta", choices=["unknown", "fallar"], default="unknown",
+                        help="(con --batch) qué hacer si no se reconoce el sistema o no hay icono")
+    args = parser.parse_args()
+    extensiones = tuple(e if e.startswith(".") else f".{e}"
+                        for e in (e.strip().lower() for e in args.extensiones.split(",")) if e)
+    excluir = EXCLUIR_POR_DEFECTO + tuple(args.excluir)
+
+    if args.estado or args.validar:
+        app = VentoyConfig(extensiones=extensiones, excluir=excluir)
+        app.solo_lectura = True
+    elif args.batch or args.vigilar or args.provisionar or args.optimizar_iconos:
+        app = VentoyConfig(si_ambiguo=args.si_ambiguo, si_falta=args.si_falta,
+                           detectar_contenido=args.contenido, extensiones=extensiones, excluir=excluir,
+                           identidad_contenido=args.identidad)
+    else:
+        app = VentoyConfigGUI()
+        app.detectar_contenido = args.contenido
+        app.identidad_contenido = args.identidad
+        app.extensiones, app.excluir = extensiones, excluir
+
+    app.simular = args.simular
+    app.compactar = args.compactar
+    app.usar_clasificador = not args.sin_clasificador
+    # Traza parchea open y os.* en todo el proceso: desde aquí, cualquier salida los restaura
+    traza = Traza(args.traza) if args.traza else None
+    perfil = None
+    try:
+        if traza is not None:
+            traza.instrumentar(app)
+        if args.perfil:
+            import cProfile
+            perfil = cProfile.Profile()
+            perfil.enable()
+        if args.estado or args.validar:
+            sys.exit(app.mostrar_resumen() if args.estado else app.validar_configuracion())
+        if args.provisionar:
+            sys.exit(app.provisionar(args.provisionar, args.copiar_tema))
+        if args.optimizar_iconos:
+            sys.exit(app.optimizar_iconos(args.quitar_sin_uso))
+        if args.vigilar:
+            sys.exit(app.vigilar())
+        if args.batch:
+            sys.exit(app.ejecutar_batch(args.tema))
+        app.run()
+    finally:
+        try:
+            if args.plan:
+                guardar_plan(args.plan, app.planes, args.simular)
+            if perfil is not None:
+                perfil.disable()
+                perfil.dump_stats(args.perfil)
+        finally:
+            if traza is not None:
+                traza.cerrar()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file